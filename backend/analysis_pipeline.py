@@ -0,0 +1,157 @@
+"""
+Analysis Pipeline - Extract problem number → Retrieve section → Analyze
+Shared by the /api/analyze endpoint and the background job workers
+"""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from pdf_service import get_pdf_service
+from gemini_service import get_gemini_service
+from precompute_service import get_precomputed_analysis, get_precomputed_mode
+from pdf_renderer import get_pdf_renderer, parse_page_selection
+import speculative_pipeline
+import usage_service
+
+
+def run_upload_pipeline(
+    file_bytes: bytes,
+    content_type: str,
+    filename: str,
+    pages: Optional[str] = None,
+    fresh: bool = False
+) -> Dict:
+    """
+    Analyze an uploaded image, or selected pages of an uploaded PDF (blocking)
+
+    PDF pages are rasterized in memory first; when several pages are
+    selected they are rendered and analyzed in parallel.
+
+    Args:
+        file_bytes: Uploaded file bytes
+        content_type: Upload MIME type
+        filename: Original filename, echoed back in the result
+        pages: PDF page selection ("2", "1,3", "2-4", "all"); default first page
+        fresh: Ignore precomputed analyses and always run a full analysis
+
+    Returns:
+        dict: Analysis for a single image/page, or {"filename", "pages": [...]}
+        with one analysis per page when several PDF pages were selected
+
+    Raises:
+        PDFRenderError: If the PDF can't be read or the page selection is invalid
+    """
+    if content_type != "application/pdf":
+        return run_analysis_pipeline(file_bytes, filename, fresh)
+
+    renderer = get_pdf_renderer()
+    page_indexes = parse_page_selection(pages, renderer.page_count(file_bytes))
+    images = renderer.render_pages(file_bytes, page_indexes)
+
+    if len(images) == 1:
+        analysis = run_analysis_pipeline(images[0], filename, fresh)
+        analysis['page'] = page_indexes[0] + 1
+        return analysis
+
+    def analyze_page(page_index: int, image_bytes: bytes) -> Dict:
+        analysis = run_analysis_pipeline(image_bytes, filename, fresh)
+        analysis['page'] = page_index + 1
+        return analysis
+
+    print(f"📑 Analyzing {len(images)} pages in parallel")
+    with ThreadPoolExecutor(max_workers=len(images), thread_name_prefix="analysis-page") as executor:
+        # Each page runs in its own copy of the request context, so usage is
+        # attributed to this client and to each page's own problem number
+        futures = [
+            executor.submit(contextvars.copy_context().run, analyze_page, page_index, image)
+            for page_index, image in zip(page_indexes, images)
+        ]
+        results = [future.result() for future in futures]
+
+    return {
+        "filename": filename,
+        "pages": results
+    }
+
+
+def run_analysis_pipeline(image_bytes: bytes, filename: str, fresh: bool = False) -> Dict:
+    """
+    Run the full drawing analysis pipeline (blocking)
+
+    Process:
+    1. Extract problem number from image
+    2. Retrieve relevant textbook section
+    3. Analyze with Gemini AI, or serve/seed from a precomputed analysis
+
+    Args:
+        image_bytes: Uploaded image file bytes
+        filename: Original filename, echoed back in the result
+        fresh: Ignore precomputed analyses and always run a full analysis
+
+    Returns:
+        dict: Analysis results with steps and request metadata
+    """
+    pdf_service = get_pdf_service()
+    gemini_service = get_gemini_service()
+
+    # Step 1: Extract problem number from image
+    print("📋 Step 1: Extracting problem number...")
+    if speculative_pipeline.is_enabled():
+        # Race extraction against local OCR while the image is decoded for step 3
+        problem_number, image, problem_source = speculative_pipeline.resolve_problem_number(
+            gemini_service, pdf_service, image_bytes
+        )
+    else:
+        problem_number = gemini_service.extract_problem_number(image_bytes)
+        image = image_bytes
+        problem_source = "extraction" if problem_number else "full_text"
+    usage_service.set_problem(problem_number)
+
+    # Step 2: Retrieve relevant textbook section
+    print("📖 Step 2: Retrieving textbook section...")
+    if problem_number:
+        textbook_context = pdf_service.get_problem_section(problem_number)
+        if not textbook_context:
+            print(f"  ⚠️  Problem {problem_number} not found, using full text")
+            textbook_context = pdf_service.get_full_text()
+    else:
+        print("  ⚠️  Problem number not detected, using full text")
+        textbook_context = pdf_service.get_full_text()
+        problem_number = None
+
+    print(f"  ✓ Context size: {len(textbook_context)} characters")
+
+    # Look up the canonical analysis for this problem, if one was precomputed
+    mode = get_precomputed_mode()
+    if usage_service.is_downgraded():
+        # Over-budget client: a stored analysis costs nothing, so always prefer it
+        fresh, mode = False, "serve"
+    precomputed = None
+    if problem_number and not fresh and mode != "off":
+        precomputed = get_precomputed_analysis(problem_number)
+
+    if precomputed and mode == "serve":
+        # Step 3 skipped: serve the canonical analysis as-is
+        print(f"⚡ Step 3: Serving precomputed analysis for Problem {problem_number}")
+        analysis = dict(precomputed)
+        source = "precomputed"
+    else:
+        # Step 3: Analyze drawing with Gemini
+        print("🤖 Step 3: Analyzing drawing with AI...")
+        analysis = gemini_service.analyze_drawing(
+            image,
+            textbook_context,
+            problem_number,
+            reference_solution=precomputed
+        )
+        source = "seeded" if precomputed else "fresh"
+
+    # Add metadata
+    analysis['filename'] = filename
+    analysis['detected_problem'] = problem_number
+    analysis['context_used'] = "specific_section" if problem_number else "full_text"
+    analysis['analysis_source'] = source
+    analysis['problem_source'] = problem_source
+
+    return analysis
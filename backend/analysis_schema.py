@@ -0,0 +1,243 @@
+"""
+Analysis Schema - Pydantic schema of an analysis and its validated parser
+The same schema is sent to Gemini as the response schema (JSON mode), and
+used to validate responses in one pass, with a light repair step for
+responses cut off mid-JSON
+"""
+
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from pydantic import ConfigDict, TypeAdapter, ValidationError, with_config
+# pydantic needs typing_extensions' TypedDict before Python 3.12
+from typing_extensions import NotRequired, TypedDict
+
+
+# TypedDicts rather than BaseModels: validation yields plain dicts directly,
+# which is about twice as fast as validating a model and dumping it again
+
+class ConstructionStep(TypedDict):
+    """One step of the construction"""
+
+    step: NotRequired[int]
+    instruction: NotRequired[str]
+    explanation: NotRequired[str]
+
+
+# Keep any extra keys a model adds instead of silently dropping them
+@with_config(ConfigDict(extra="allow"))
+class DrawingAnalysis(TypedDict, total=False):
+    """Structured analysis returned to the frontend (see ANALYSIS_RESPONSE_FORMAT)"""
+
+    problem_identification: str
+    given_information: List[str]
+    required_output: str
+    key_concept: str
+    construction_steps: List[ConstructionStep]
+    common_mistakes: List[str]
+    # Set (with message) only when the image is rejected as not a drawing
+    error: str
+    message: str
+
+
+_analysis_adapter = TypeAdapter(DrawingAnalysis)
+
+# Fields the model must always produce in JSON mode
+REQUIRED_FIELDS = ["problem_identification", "construction_steps"]
+
+# JSON strings (possibly unterminated at the end) and structural characters
+_JSON_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*("?)|[{}\[\],]')
+
+
+def gemini_response_schema(schema_type=DrawingAnalysis, required: Optional[List[str]] = None) -> Dict:
+    """
+    Convert a Pydantic JSON schema to the OpenAPI subset Gemini accepts
+
+    Gemini's response_schema has no $ref/$defs, defaults, titles or
+    anyOf-with-null, so references are inlined and Optional[X] becomes
+    a nullable X.
+
+    Args:
+        schema_type: TypedDict or Pydantic model to convert
+        required: Top-level required fields (default: the schema's own)
+    """
+    json_schema = TypeAdapter(schema_type).json_schema()
+    defs = json_schema.get("$defs", {})
+
+    def convert(node: Dict) -> Dict:
+        if "$ref" in node:
+            node = defs[node["$ref"].rsplit("/", 1)[-1]]
+
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            converted = convert(options[0])
+            if len(options) < len(node["anyOf"]):
+                converted["nullable"] = True
+            return converted
+
+        converted = {"type": node["type"]}
+        if "description" in node:
+            converted["description"] = node["description"]
+        if "properties" in node:
+            converted["properties"] = {name: convert(child) for name, child in node["properties"].items()}
+            # Ask the model for every field; validation itself stays lenient
+            converted["required"] = list(node["properties"])
+        if "items" in node:
+            converted["items"] = convert(node["items"])
+        return converted
+
+    schema = convert(json_schema)
+    schema["required"] = list(required if required is not None else json_schema.get("required", []))
+    return schema
+
+
+def repair_truncated_json(text: str) -> Optional[str]:
+    """
+    Close a JSON document that was cut off part-way through
+
+    Closes an unterminated string and any open objects/arrays; if that
+    doesn't parse (e.g. cut inside a key), drops the incomplete trailing
+    element instead.
+
+    Returns:
+        str: Repaired JSON text, or None if the text isn't truncated JSON
+    """
+    stack = []
+    unterminated_at = None  # End of an unterminated trailing string
+    last_complete = None  # (cut position, open containers at that point)
+
+    # Only strings and structural characters matter; the regex skips the rest
+    for match in _JSON_TOKEN.finditer(text):
+        char = match.group()[0]
+        if char == '"':
+            if not match.group(1):
+                unterminated_at = match.end()
+                break
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack:
+                return None
+            stack.pop()
+            last_complete = (match.end(), list(stack))
+        else:
+            last_complete = (match.start(), list(stack))
+
+    if not stack and unterminated_at is None:
+        return None  # Not truncated; invalid for some other reason
+
+    # First try: finish the string (dropping a dangling backslash) and close
+    # everything that's open
+    if unterminated_at is not None:
+        closed = text[:unterminated_at] + '"'
+    else:
+        closed = re.sub(r'[\s,:]+$', '', text)
+    closed = closed + "".join(reversed(stack))
+    try:
+        json.loads(closed)
+        return closed
+    except json.JSONDecodeError:
+        pass
+
+    # Otherwise cut back to the last complete element
+    if last_complete is None:
+        return None
+    cut, open_containers = last_complete
+    return text[:cut] + "".join(reversed(open_containers))
+
+
+def parse_analysis(response_text: str) -> Tuple[Optional[Dict], str]:
+    """
+    Parse and validate an analysis response
+
+    Args:
+        response_text: Raw model output
+
+    Returns:
+        (analysis, outcome): Validated analysis dict and "valid" or
+        "repaired", or (None, "failed") if it couldn't be parsed
+    """
+    cleaned = response_text.strip()
+    if cleaned.startswith('```'):
+        # JSON mode doesn't fence, but models without a schema may
+        # (plain slicing: an end-anchored regex rescans every whitespace run)
+        cleaned = cleaned[3:]
+        if cleaned[:4].lower() == 'json':
+            cleaned = cleaned[4:]
+        if cleaned.endswith('```'):
+            cleaned = cleaned[:-3]
+        cleaned = cleaned.strip()
+
+    # Fast path: orjson parse, then one validation pass
+    try:
+        return _finish(_validate(cleaned)), "valid"
+    except (orjson.JSONDecodeError, ValidationError):
+        pass
+
+    repaired = repair_truncated_json(cleaned)
+    if repaired is not None:
+        try:
+            analysis = _validate(repaired)
+            print(f"  🩹 Repaired truncated JSON response ({len(cleaned)} characters)")
+            return _finish(analysis), "repaired"
+        except (orjson.JSONDecodeError, ValidationError):
+            pass
+
+    print("❌ Failed to parse JSON response")
+    print(f"  Raw response: {response_text[:200]}...")
+    return None, "failed"
+
+
+def _validate(text: str) -> Dict:
+    """Parse and validate JSON text against DrawingAnalysis"""
+    return _analysis_adapter.validate_python(orjson.loads(text))
+
+
+def _finish(analysis: Dict) -> Dict:
+    """Validated analysis -> response dict, with defaults for omitted fields"""
+    if analysis.get("error") == "not_a_drawing":
+        message = analysis.get("message") or "Not a valid drawing"
+        print(f"⚠️  AI rejected: {message}")
+        return {"error": "not_a_drawing", "message": message}
+
+    analysis.setdefault("problem_identification", "Not provided")
+    steps = analysis.setdefault("construction_steps", [])
+    for number, step in enumerate(steps, 1):
+        step.setdefault("step", number)
+        step.setdefault("instruction", "Step instruction not provided")
+        step.setdefault("explanation", "Explanation not provided")
+
+    print(f"  ✅ Parsed {len(steps)} construction steps")
+    return analysis
+
+
+class ParseStats:
+    """How analysis responses were parsed: first try, after repair, after re-ask, or not at all"""
+
+    OUTCOMES = ("valid", "repaired", "reasked", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {outcome: 0 for outcome in self.OUTCOMES}
+        self.reasks = 0
+
+    def record(self, outcome: str, reasked: bool = False):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.reasks += reasked
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "requests": total,
+                **self.counts,
+                "reasks": self.reasks,
+                # Requests whose first response didn't validate as returned
+                "parse_failure_rate": round((total - self.counts["valid"]) / total, 3) if total else 0.0,
+                # Requests that ended in a parse error for the user
+                "final_failure_rate": round(self.counts["failed"] / total, 3) if total else 0.0
+            }
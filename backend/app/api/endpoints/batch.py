@@ -0,0 +1,235 @@
+"""
+Batch file upload endpoint
+"""
+import asyncio
+import io
+import json
+import zipfile
+import zlib
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.models.schemas import BatchFileResult, ErrorResponse
+from app.api.endpoints.upload import file_service
+
+router = APIRouter()
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+# (filename, callable returning the file bytes)
+BatchEntry = Tuple[str, Callable[[], bytes]]
+
+
+@router.post(
+    "/upload/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "model": BatchFileResult,
+            "description": "Newline-delimited JSON, one result per file in completion order",
+            "content": {"application/x-ndjson": {}}
+        },
+        400: {"model": ErrorResponse, "description": "Bad Request - Too many files or mixed archive upload"},
+        413: {"model": ErrorResponse, "description": "Payload Too Large - Archive exceeds size limit"},
+        422: {"model": ErrorResponse, "description": "Unprocessable Entity - Corrupted archive"}
+    },
+    summary="Upload and process several files",
+    description="Upload several PDF/image files, or a single ZIP archive of them, and stream back extracted text per file"
+)
+async def upload_batch(files: List[UploadFile] = File(..., description="PDF/image files, or a single ZIP archive")):
+    """
+    Upload and process several files in one request
+
+    - **files**: PDF or image files, or exactly one ZIP archive containing them
+
+    Files are processed concurrently and each result is streamed back as a
+    JSON line as soon as it finishes, so the order of lines is the completion
+    order. Use the `index` field to match results to inputs.
+    """
+    if len(files) == 1 and _is_archive(files[0]):
+        archive = await _open_archive(files[0])
+        entries = _archive_entries(archive)
+    else:
+        archive = None
+        entries = await _upload_entries(files)
+
+    if len(entries) > settings.MAX_BATCH_FILES:
+        if archive is not None:
+            archive.close()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: {len(entries)}. A batch may contain at most {settings.MAX_BATCH_FILES} files."
+        )
+
+    return StreamingResponse(
+        _stream_results(entries, archive),
+        media_type="application/x-ndjson"
+    )
+
+
+def _is_archive(file: UploadFile) -> bool:
+    """Check whether an uploaded file is a ZIP archive"""
+    filename = (file.filename or "").lower()
+    return filename.endswith(".zip") or file.content_type in ZIP_CONTENT_TYPES
+
+
+async def _open_archive(file: UploadFile) -> zipfile.ZipFile:
+    """
+    Open an uploaded ZIP archive in place
+
+    The archive is read straight from the spooled upload file rather than
+    copied into memory; members are decompressed lazily, one at a time,
+    when they are processed, and nothing is extracted to disk.
+
+    Raises:
+        HTTPException: If the archive is too large or corrupted
+    """
+    archive_size = file.size
+    if archive_size is None:
+        archive_size = await run_in_threadpool(file.file.seek, 0, io.SEEK_END)
+
+    if archive_size > settings.MAX_ARCHIVE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Archive too large. Maximum size is {settings.MAX_ARCHIVE_SIZE // (1024 * 1024)}MB."
+        )
+
+    try:
+        return await run_in_threadpool(zipfile.ZipFile, file.file)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid or corrupted ZIP archive: {str(e)}"
+        )
+
+
+def _archive_entries(archive: zipfile.ZipFile) -> List[BatchEntry]:
+    """List the processable members of an archive, skipping folders and OS metadata"""
+    entries = []
+
+    for info in archive.infolist():
+        basename = info.filename.rsplit("/", 1)[-1]
+        if info.is_dir() or info.filename.startswith("__MACOSX/") or basename.startswith("."):
+            continue
+        entries.append((info.filename, _member_reader(archive, info)))
+
+    return entries
+
+
+def _member_reader(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Callable[[], bytes]:
+    """
+    Build a reader that decompresses a single archive member on demand
+
+    Raises (when called):
+        HTTPException: If the member is too large, corrupted, encrypted
+            or uses an unsupported compression method
+    """
+    def read() -> bytes:
+        if info.file_size > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE // (1024 * 1024)}MB."
+            )
+        try:
+            return archive.read(info)
+        except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+            # Bad CRC-32, truncated or otherwise corrupted member
+            raise HTTPException(status_code=422, detail=f"Corrupted archive member: {str(e)}")
+        except RuntimeError as e:
+            # Encrypted member (no password can be supplied)
+            raise HTTPException(status_code=422, detail=f"Cannot read archive member: {str(e)}")
+        except NotImplementedError as e:
+            # Unsupported compression method
+            raise HTTPException(status_code=415, detail=f"Unsupported archive member: {str(e)}")
+
+    return read
+
+
+async def _upload_entries(files: List[UploadFile]) -> List[BatchEntry]:
+    """
+    Read plain uploaded files into batch entries
+
+    Raises:
+        HTTPException: If an archive is mixed with other files
+    """
+    entries = []
+
+    for file in files:
+        if _is_archive(file):
+            raise HTTPException(
+                status_code=400,
+                detail="ZIP archives must be uploaded on their own, not mixed with other files."
+            )
+        content = await file.read()
+        entries.append((file.filename, _content_reader(content)))
+
+    return entries
+
+
+def _content_reader(content: bytes) -> Callable[[], bytes]:
+    """Build a reader for an already-read upload"""
+    def read() -> bytes:
+        if len(content) > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE // (1024 * 1024)}MB."
+            )
+        return content
+
+    return read
+
+
+async def _process_entry(index: int, filename: str, read: Callable[[], bytes]) -> dict:
+    """Process one batch entry off the event loop, turning failures into error results"""
+    try:
+        content = await run_in_threadpool(read)
+        result = await run_in_threadpool(file_service.process_content, filename, content)
+        return {"index": index, "status": "ok", **result}
+    except HTTPException as e:
+        return {
+            "index": index,
+            "filename": filename,
+            "status": "error",
+            "detail": e.detail,
+            "status_code": e.status_code
+        }
+
+
+async def _stream_results(
+    entries: List[BatchEntry],
+    archive: Optional[zipfile.ZipFile] = None
+) -> AsyncIterator[bytes]:
+    """
+    Process entries with bounded concurrency and yield results as they finish
+
+    At most `BATCH_CONCURRENCY` entries are in flight at once, so only that
+    many archive members are decompressed in memory at any time.
+    """
+    pending = set()
+
+    try:
+        for index, (filename, read) in enumerate(entries):
+            if len(pending) >= settings.BATCH_CONCURRENCY:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield _encode(task.result())
+            pending.add(asyncio.create_task(_process_entry(index, filename, read)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield _encode(task.result())
+    finally:
+        # Client disconnected or stream finished: stop outstanding work
+        for task in pending:
+            task.cancel()
+        if archive is not None:
+            archive.close()
+
+
+def _encode(result: dict) -> bytes:
+    """Encode a result as one line of newline-delimited JSON"""
+    return (json.dumps(result) + "\n").encode("utf-8")
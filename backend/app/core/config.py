@@ -25,6 +25,11 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: List[str] = [".pdf", ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff"]
     
+    # Batch Upload Settings
+    MAX_BATCH_FILES: int = 50
+    MAX_ARCHIVE_SIZE: int = 100 * 1024 * 1024  # 100MB
+    BATCH_CONCURRENCY: int = 4
+    
     class Config:
         case_sensitive = True
 
@@ -4,7 +4,7 @@ Main FastAPI application
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.api.endpoints import health, upload
+from app.api.endpoints import health, upload, batch
 
 
 def create_application() -> FastAPI:
@@ -34,6 +34,7 @@ def create_application() -> FastAPI:
     # Include routers
     app.include_router(health.router, tags=["Health"])
     app.include_router(upload.router, tags=["File Processing"])
+    app.include_router(batch.router, tags=["File Processing"])
     
     return app
 
@@ -1,6 +1,7 @@
 """
 Pydantic models for request/response validation
 """
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -20,6 +21,28 @@ class FileUploadResponse(BaseModel):
         }
 
 
+class BatchFileResult(BaseModel):
+    """One line of the newline-delimited JSON stream returned by batch upload"""
+    index: int
+    filename: str
+    status: str
+    text: Optional[str] = None
+    file_type: Optional[str] = None
+    detail: Optional[str] = None
+    status_code: Optional[int] = None
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "index": 0,
+                "filename": "scans/page1.png",
+                "status": "ok",
+                "text": "Extracted text content...",
+                "file_type": "image/png"
+            }
+        }
+
+
 class ErrorResponse(BaseModel):
     """Error response model"""
     detail: str
@@ -30,8 +30,24 @@ class FileService:
         # Read file content
         file_content = await file.read()
         
+        return self.process_content(file.filename, file_content)
+    
+    def process_content(self, filename: str, file_content: bytes) -> dict:
+        """
+        Extract text from already-read file content
+        
+        Args:
+            filename: Original filename, used to detect the file type
+            file_content: Binary content of the file
+            
+        Returns:
+            Dictionary containing extracted text, filename, and file type
+            
+        Raises:
+            HTTPException: If file type is unsupported or processing fails
+        """
         # Detect file type
-        file_type = mimetypes.guess_type(file.filename)[0]
+        file_type = mimetypes.guess_type(filename)[0]
         
         if not file_type:
             raise HTTPException(
@@ -56,7 +72,6 @@ class FileService:
         
         return {
             "text": extracted_text,
-            "filename": file.filename,
+            "filename": filename,
             "file_type": file_type
         }
-
@@ -0,0 +1,4 @@
+"""
+Microbenchmarks and regression checks for the backend hot paths
+Run from backend/: python -m benchmarks --help
+"""
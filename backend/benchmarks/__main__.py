@@ -0,0 +1,174 @@
+"""
+Run the benchmark suite and compare against the stored baseline
+
+Usage (from backend/):
+    python -m benchmarks                     # run, compare with baseline
+    python -m benchmarks --save-baseline     # run and store as the new baseline
+    python -m benchmarks -k parse_response   # only cases whose name contains this
+    python -m benchmarks --threshold 1.5     # allow up to 50% slowdown
+
+Exits with status 1 if any case is slower than baseline x threshold, and
+with status 2 if there is no baseline to compare against. Baselines are
+machine-specific and not committed: record one with --save-baseline on the
+machine that runs the comparison (see the README for recording it from the
+merge base in a temporary worktree).
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+from pathlib import Path
+from typing import Dict, Optional
+
+# Backend modules (pdf_service, gemini_service, app/) are imported top-level
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.cases import BENCHMARKS, SkipBenchmark  # noqa: E402
+
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# Default allowed slowdown vs. baseline before a case counts as a regression
+DEFAULT_THRESHOLD = float(os.getenv('BENCH_THRESHOLD', '1.25'))
+
+
+def measure(fn, repeat: int, min_time: float) -> float:
+    """
+    Time a callable, returning the best per-call time in seconds
+
+    The loop count is calibrated so each repeat takes at least `min_time`;
+    the minimum over repeats is the least noisy estimate.
+    """
+    timer = timeit.Timer(fn)
+    fn()  # warm-up: lazy imports, caches, first-call allocation
+
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    times = [elapsed] + timer.repeat(repeat=repeat - 1, number=number)
+    return min(times) / number
+
+
+def load_baseline(path: Path) -> Dict[str, float]:
+    """Stored per-call times by case name (empty if no baseline yet)"""
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)["results"]
+
+
+def save_baseline(path: Path, results: Dict[str, float]):
+    """Store results as the new baseline"""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results
+        }, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def format_time(seconds: float) -> str:
+    """Human-readable duration"""
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+
+def compare(current: float, baseline: Optional[float], threshold: float) -> str:
+    """Status of one case against its baseline"""
+    if baseline is None:
+        return "new"
+    ratio = current / baseline
+    if ratio > threshold:
+        return f"❌ {ratio:.2f}x slower"
+    if ratio < 1 / threshold:
+        return f"⚡ {1 / ratio:.2f}x faster"
+    return f"✓ {ratio:.2f}x"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backend microbenchmarks with baseline regression check")
+    parser.add_argument("-k", dest="pattern", default="",
+                        help="Only run cases whose name contains this substring")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE,
+                        help=f"Baseline file (default: {DEFAULT_BASELINE.name})")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store this run's results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Fail when a case is slower than baseline x threshold "
+                             "(default: BENCH_THRESHOLD or 1.25)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Timing repeats per case; the best is kept (default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="Minimum seconds per repeat (default: 0.2)")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    if not baseline and not args.save_baseline:
+        # Without a baseline nothing can be flagged, so don't report success
+        print(f"❌ No baseline at {args.baseline}; run `python -m benchmarks --save-baseline` "
+              f"first (from this commit, or from the merge base as described in the README)")
+        return 2
+
+    results = {}
+    regressions = []
+
+    print(f"\n⏱️  Running benchmarks (threshold {args.threshold:.2f}x, "
+          f"{'baseline ' + args.baseline.name if baseline else 'no baseline'})\n")
+
+    for name, setup in BENCHMARKS.items():
+        if args.pattern not in name:
+            continue
+
+        # Services log progress with print(); keep it out of the timings and report
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            try:
+                fn = setup()
+            except SkipBenchmark as e:
+                skipped_reason = str(e)
+                fn = None
+            else:
+                seconds = measure(fn, args.repeat, args.min_time)
+
+        if fn is None:
+            print(f"  {name:<55} {'skipped':>12}  ({skipped_reason})")
+            continue
+
+        results[name] = seconds
+        status = compare(seconds, baseline.get(name), args.threshold)
+        if status.startswith("❌"):
+            regressions.append(name)
+        print(f"  {name:<55} {format_time(seconds):>12}  {status}")
+
+    if args.save_baseline:
+        # Keep entries for cases that weren't selected by -k
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f"\n💾 Saved baseline to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.2f}x baseline")
+        return 1
+
+    new_cases = [name for name in results if name not in baseline]
+    if new_cases:
+        print(f"\nℹ️  {len(new_cases)} case(s) not in the baseline; run with --save-baseline to include them")
+    print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Benchmark cases for the parsing, prompt and file-processing hot paths
+
+Each case is a setup function returning the zero-argument callable to time.
+Setup work (building fixtures, writing temp files) is not timed.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict
+
+from benchmarks import fixtures
+
+
+# Synthetic textbook sizes, in pages (the real textbook has 12)
+TEXTBOOK_SIZES = (12, 48, 192)
+
+# name -> setup function returning the callable to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+class SkipBenchmark(Exception):
+    """Raised by a setup function when the case can't run in this environment"""
+
+
+def benchmark(name: str):
+    """Register a benchmark setup function under `name`"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _offline_gemini_service():
+    """GeminiService without an API key or client; only pure methods may be called"""
+    from gemini_service import GeminiService
+    return object.__new__(GeminiService)
+
+
+# Scratch directory for temp PDFs and index files, removed at exit
+_SCRATCH_DIR = tempfile.mkdtemp(prefix="edm-bench-")
+atexit.register(shutil.rmtree, _SCRATCH_DIR, ignore_errors=True)
+
+
+def _write_temp_pdf(pdf_bytes: bytes) -> str:
+    """Write a PDF to a temp file that lives for the rest of the run"""
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=_SCRATCH_DIR)
+    with os.fdopen(fd, 'wb') as file:
+        file.write(pdf_bytes)
+    return path
+
+
+# --- PDFService ---------------------------------------------------------------
+
+def _register_textbook_cases(pages: int):
+    @benchmark(f"pdf_service.load_and_parse[cold,{pages}p]")
+    def load_cold():
+        from pdf_service import PDFService
+        pdf_path = _write_temp_pdf(fixtures.make_textbook_pdf(pages))
+        index_dir = tempfile.mkdtemp(dir=_SCRATCH_DIR)
+        os.environ['TEXTBOOK_INDEX_DIR'] = index_dir
+
+        def run():
+            # Fresh index directory contents each time so the PDF is really parsed
+            service = PDFService()
+            service.load_and_parse(pdf_path)
+            service.index.close()
+            for name in os.listdir(index_dir):
+                os.remove(os.path.join(index_dir, name))
+        return run
+
+    @benchmark(f"pdf_service.load_and_parse[warm,{pages}p]")
+    def load_warm():
+        from pdf_service import PDFService
+        pdf_path = _write_temp_pdf(fixtures.make_textbook_pdf(pages))
+        index_dir = tempfile.mkdtemp(dir=_SCRATCH_DIR)
+        os.environ['TEXTBOOK_INDEX_DIR'] = index_dir
+        PDFService().load_and_parse(pdf_path)  # build the shared index once
+
+        def run():
+            service = PDFService()
+            service.load_and_parse(pdf_path)
+            service.index.close()
+        return run
+
+    @benchmark(f"pdf_service._parse_problem_sections[{pages}p]")
+    def parse_sections():
+        from pdf_service import PDFService
+        service = PDFService()
+        full_text = "".join(service._extract_pages(fixtures.make_textbook_pdf(pages), "<synthetic>"))
+        return lambda: service._parse_problem_sections(full_text)
+
+    @benchmark(f"text_normalizer.normalize_pages[{pages}p]")
+    def normalize_pages():
+        from pdf_service import PDFService
+        from text_normalizer import normalize_pages
+        page_texts = PDFService()._extract_pages(fixtures.make_textbook_pdf(pages), "<synthetic>")
+        return lambda: normalize_pages(page_texts)
+
+
+for _pages in TEXTBOOK_SIZES:
+    _register_textbook_cases(_pages)
+
+
+# --- GeminiService --------------------------------------------------------------
+
+@benchmark("gemini_service._build_analysis_prompt[section]")
+def build_prompt_section():
+    service = _offline_gemini_service()
+    context = "\n".join(fixtures.make_textbook_pages(1)[0])
+    return lambda: service._build_analysis_prompt(context, "12-1")
+
+
+@benchmark("gemini_service._build_analysis_prompt[full_text]")
+def build_prompt_full_text():
+    service = _offline_gemini_service()
+    context = "\n".join("\n".join(page) for page in fixtures.make_textbook_pages(48))
+    return lambda: service._build_analysis_prompt(context, None)
+
+
+@benchmark("gemini_service._parse_response[6 steps]")
+def parse_response_small():
+    service = _offline_gemini_service()
+    response = fixtures.make_analysis_response(6)
+    return lambda: service._parse_response(response)
+
+
+@benchmark("gemini_service._parse_response[500 steps]")
+def parse_response_large():
+    service = _offline_gemini_service()
+    response = fixtures.make_analysis_response(500)
+    return lambda: service._parse_response(response)
+
+
+@benchmark("gemini_service._parse_response[fenced]")
+def parse_response_fenced():
+    service = _offline_gemini_service()
+    response = fixtures.make_fenced_response(50)
+    return lambda: service._parse_response(response)
+
+
+@benchmark("gemini_service._parse_response[truncated]")
+def parse_response_truncated():
+    service = _offline_gemini_service()
+    response = fixtures.make_truncated_response(50)
+    return lambda: service._parse_response(response)
+
+
+@benchmark("gemini_service._load_image[png 2000x1500]")
+def load_image_png():
+    service = _offline_gemini_service()
+    image_bytes = fixtures.make_image(2000, 1500, "PNG")
+    return lambda: service._load_image(image_bytes).load()
+
+
+@benchmark("gemini_service._load_image[jpeg 2000x1500]")
+def load_image_jpeg():
+    service = _offline_gemini_service()
+    image_bytes = fixtures.make_image(2000, 1500, "JPEG")
+    return lambda: service._load_image(image_bytes).load()
+
+
+# --- Text extractor (app/) ------------------------------------------------------
+
+@benchmark("app.PDFProcessor.extract_text[12p]")
+def pdf_processor():
+    from app.services.pdf_processor import PDFProcessor
+    pdf_bytes = fixtures.make_textbook_pdf(12)
+    return lambda: PDFProcessor.extract_text(pdf_bytes)
+
+
+@benchmark("app.ImageProcessor.extract_text[png 1200x900]")
+def image_processor():
+    if shutil.which("tesseract") is None:
+        raise SkipBenchmark("tesseract binary not installed")
+    from app.services.image_processor import ImageProcessor
+    image_bytes = fixtures.make_image(1200, 900, "PNG")
+    return lambda: ImageProcessor.extract_text(image_bytes)
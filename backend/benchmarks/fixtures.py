@@ -0,0 +1,144 @@
+"""
+Synthetic inputs for the benchmarks: textbook PDFs, images and model responses
+Generated in memory so no binary fixtures need to live in the repo
+"""
+
+import io
+import json
+from typing import List
+
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """
+    Build a minimal text PDF (one Helvetica text block per page)
+
+    Args:
+        pages: Lines of text for each page
+
+    Returns:
+        bytes: PDF file content readable by PyPDF2
+    """
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    page_tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(
+            f"({_escape(line)}) Tj T*" for line in lines
+        ) + " ET"
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream.encode("latin-1")))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (page_tree, font, content)
+        ))
+
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+    return out.getvalue()
+
+
+def _escape(line: str) -> str:
+    """Escape a line for a PDF string literal"""
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_textbook_pages(page_count: int, problems_per_page: int = 1) -> List[List[str]]:
+    """
+    Lines of a synthetic textbook in the shape of the real one: running
+    header and footer, page numbers, hyphenated line breaks and
+    "Problem 12-X" markers followed by statement and solution text
+    """
+    pages = []
+    problem = 1
+
+    for page_num in range(1, page_count + 1):
+        lines = ["ENGINEERING DRAWING - PROJECTIONS OF PLANES", ""]
+        for _ in range(problems_per_page):
+            lines += [
+                f"Problem 12-{problem}. A regular hexagonal plane of 30 mm side has one",
+                "of its sides in the HP and its surface is inclined at 45 degrees to the",
+                "HP. Draw its projections when the side in the HP makes 30 degrees with",
+                "the VP. Solution: Draw the hexagon in the top view with one side per-",
+                "pendicular to xy. Project the front view and tilt it so that the sur-",
+                "face makes the required angle with the HP, then project the new top",
+                "view. Finally rotate the top view so that the side makes the given",
+                "angle with the VP and project the final front view.",
+                "",
+            ]
+            problem += 1
+        lines += ["Chapter 12", str(page_num)]
+        pages.append(lines)
+
+    return pages
+
+
+def make_textbook_pdf(page_count: int) -> bytes:
+    """Synthetic textbook PDF with one problem per page"""
+    return make_pdf(make_textbook_pages(page_count))
+
+
+def make_image(width: int, height: int, fmt: str = "PNG") -> bytes:
+    """Encoded test image with a drawing-like pattern of lines and text"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for x in range(0, width, 40):
+        draw.line([(x, 0), (width - x, height)], fill="black", width=2)
+    for y in range(40, height, 120):
+        draw.text((40, y), f"Problem 12-{y % 13 + 1}: draw the projections", fill="black")
+
+    out = io.BytesIO()
+    image.save(out, fmt)
+    return out.getvalue()
+
+
+def make_analysis_response(step_count: int) -> str:
+    """A well-formed analysis response with the given number of steps"""
+    return json.dumps({
+        "problem_identification": "Hexagonal plane inclined to HP and VP",
+        "given_information": [f"Given fact {i}" for i in range(step_count)],
+        "required_output": "Front and top views",
+        "key_concept": "Change of position method",
+        "construction_steps": [
+            {
+                "step": i + 1,
+                "instruction": f"Instruction for step {i + 1} " * 5,
+                "explanation": f"Explanation for step {i + 1} " * 10
+            }
+            for i in range(step_count)
+        ],
+        "common_mistakes": [f"Mistake {i}" for i in range(step_count)]
+    }, indent=2)
+
+
+def make_fenced_response(step_count: int) -> str:
+    """Analysis response wrapped in a markdown code fence"""
+    return "```json\n" + make_analysis_response(step_count) + "\n```"
+
+
+def make_truncated_response(step_count: int) -> str:
+    """Analysis response cut off mid-way, as when the output token limit is hit"""
+    response = make_analysis_response(step_count)
+    return response[:int(len(response) * 0.7)]
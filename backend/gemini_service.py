@@ -6,17 +6,66 @@ Two-step process: Extract problem number → Analyze with targeted context
 import os
 import json
 import re
-from typing import Dict, Optional
+import threading
+import time
+from typing import Dict, List, Optional
 from pathlib import Path
-import google.generativeai as genai
-from PIL import Image
 import io
 from dotenv import load_dotenv
 
+from model_router import ModelRouter
+from analysis_schema import ParseStats, gemini_response_schema, parse_analysis, REQUIRED_FIELDS
+from usage_service import is_downgraded
+
 # Load environment variables
 load_dotenv()
 
 
+# Expected JSON structure and guidelines, shared by image and text-only prompts
+ANALYSIS_RESPONSE_FORMAT = """{
+  "problem_identification": "Brief description of what problem this is",
+  "given_information": [
+    "List each piece of given information",
+    "Example: Circular plate 50mm diameter",
+    "Example: Appears as ellipse in front view"
+  ],
+  "required_output": "What needs to be drawn/completed",
+  "key_concept": "Main concept from textbook being applied",
+  "construction_steps": [
+    {
+      "step": 1,
+      "instruction": "Clear, actionable instruction",
+      "explanation": "Why this step is necessary and what principle applies"
+    },
+    {
+      "step": 2,
+      "instruction": "Next instruction",
+      "explanation": "Explanation with reasoning"
+    }
+    // Continue for 4-6 steps total
+  ],
+  "common_mistakes": [
+    "What students typically get wrong",
+    "Common errors to avoid"
+  ]
+}
+
+=== GUIDELINES ===
+- Provide 4-6 construction steps (not too few, not too many)
+- Each step must be clear and actionable
+- Use exact terminology from the textbook
+- Be educational and encouraging
+- Reference specific concepts or methods from textbook when relevant
+- Steps should be in logical construction order
+
+IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks."""
+
+# Appended to the original request when a response can't be parsed or repaired
+REASK_INSTRUCTION = """
+Your previous response was not a valid, complete JSON object.
+Respond again with ONLY the complete JSON object in the structure above, keeping each field concise."""
+
+
 class GeminiService:
     """Service to interact with Gemini AI for drawing analysis"""
     
@@ -26,39 +75,86 @@ class GeminiService:
         if not self.api_key:
             raise ValueError("❌ GEMINI_API_KEY not found in environment")
         
+        # Heavy import (~0.8s), deferred so it doesn't slow down server startup
+        import google.generativeai as genai
+        
         # Configure Gemini
         genai.configure(api_key=self.api_key)
         
-        # Model configuration
-        self.model_name = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-exp')
-        self.generation_config = {
+        # Per-stage models: a small, fast model for problem-number extraction
+        # and a stronger one for the full analysis, each with configured fallbacks
+        default_model = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-exp')
+        
+        extraction_models = _model_list(
+            os.getenv('GEMINI_EXTRACT_MODEL', 'gemini-2.0-flash-lite'),
+            os.getenv('GEMINI_EXTRACT_FALLBACK_MODELS', default_model)
+        )
+        analysis_models = _model_list(
+            os.getenv('GEMINI_ANALYSIS_MODEL', default_model),
+            os.getenv('GEMINI_ANALYSIS_FALLBACK_MODELS', 'gemini-2.0-flash')
+        )
+        
+        # Extraction only needs a few tokens ("12-12"); analysis needs room for JSON
+        self.extraction_config = {
+            "temperature": 0.0,
+            "max_output_tokens": 16,
+        }
+        self.analysis_config = {
             "temperature": 0.2,  # Low temperature for consistent, factual responses
             "top_p": 0.95,
             "top_k": 40,
             "max_output_tokens": 8192,
         }
+        if os.getenv('GEMINI_STRUCTURED_OUTPUT', 'true').lower() in ('1', 'true', 'yes', 'on'):
+            # JSON mode constrained to the DrawingAnalysis schema
+            self.analysis_config["response_mime_type"] = "application/json"
+            self.analysis_config["response_schema"] = gemini_response_schema(required=REQUIRED_FIELDS)
         
-        # Initialize model
-        self.model = genai.GenerativeModel(
-            model_name=self.model_name,
-            generation_config=self.generation_config
+        # One re-ask per request, only if it can still finish within this budget
+        self.reask_budget = float(os.getenv('GEMINI_REASK_BUDGET_SECONDS', '30'))
+        self.parse_stats = ParseStats()
+        
+        self.extraction_router = ModelRouter(
+            "extraction",
+            [(name, genai.GenerativeModel(model_name=name, generation_config=self.extraction_config))
+             for name in extraction_models],
+            latency_budget=float(os.getenv('GEMINI_EXTRACT_LATENCY_BUDGET', '3')),
+            timeout=float(os.getenv('GEMINI_EXTRACT_TIMEOUT', '15'))
+        )
+        self.analysis_router = ModelRouter(
+            "analysis",
+            [(name, genai.GenerativeModel(model_name=name, generation_config=self.analysis_config))
+             for name in analysis_models],
+            latency_budget=float(os.getenv('GEMINI_ANALYSIS_LATENCY_BUDGET', '20')),
+            timeout=float(os.getenv('GEMINI_ANALYSIS_TIMEOUT', '120'))
         )
         
-        print(f"✅ Gemini Service initialized with model: {self.model_name}")
+        # Primary analysis model; precomputed analyses are versioned by it
+        self.model_name = self.analysis_router.primary_model_name
+        
+        print(f"✅ Gemini Service initialized: extraction {extraction_models}, analysis {analysis_models}")
+    
+    def get_model_stats(self) -> Dict:
+        """Per-stage routing order, per-model latency/error stats and parse outcomes"""
+        return {
+            "extraction": self.extraction_router.get_stats(),
+            "analysis": self.analysis_router.get_stats(),
+            "parsing": self.parse_stats.to_dict()
+        }
     
     def extract_problem_number(self, image_bytes: bytes) -> Optional[str]:
         """
         Extract problem number from image using Gemini Vision
         
         Args:
-            image_bytes: Image file bytes
+            image_bytes: Image file bytes (or an image from prepare_image)
             
         Returns:
             str: Problem number (e.g., "12-12") or None if not found
         """
         try:
             # Prepare image
-            image = Image.open(io.BytesIO(image_bytes))
+            image = self._load_image(image_bytes)
             
             # Simple prompt to extract problem number
             prompt = """
@@ -77,10 +173,10 @@ Response (just the number, nothing else):
             print("🔍 Extracting problem number from image...")
             
             # Send to Gemini
-            response = self.model.generate_content([prompt, image])
+            response, model_name = self.extraction_router.generate([prompt, image])
             result = response.text.strip()
             
-            print(f"  Raw response: {result}")
+            print(f"  Raw response ({model_name}): {result}")
             
             # Parse response to extract problem number
             # Look for pattern "12-X" or "Problem 12-X"
@@ -101,53 +197,112 @@ Response (just the number, nothing else):
         self, 
         image_bytes: bytes, 
         textbook_context: str,
-        problem_number: Optional[str] = None
+        problem_number: Optional[str] = None,
+        reference_solution: Optional[Dict] = None
     ) -> Dict:
         """
         Analyze drawing and generate step-by-step solution
         
         Args:
-            image_bytes: Image file bytes
+            image_bytes: Image file bytes (or an image from prepare_image)
             textbook_context: Relevant textbook section text
             problem_number: Optional problem number for context
+            reference_solution: Optional precomputed solution to seed the answer
             
         Returns:
             dict: Analysis results with steps
         """
         try:
             # Prepare image
-            image = Image.open(io.BytesIO(image_bytes))
+            image = self._load_image(image_bytes)
             
             # Construct prompt
-            prompt = self._build_analysis_prompt(textbook_context, problem_number)
+            prompt = self._build_analysis_prompt(textbook_context, problem_number, reference_solution)
             
             print(f"🤖 Analyzing drawing with Gemini...")
             print(f"  Context size: {len(textbook_context)} characters")
             
-            # Send to Gemini
-            response = self.model.generate_content([prompt, image])
-            result_text = response.text.strip()
+            # Send to Gemini and parse the JSON response
+            return self._generate_analysis([prompt, image])
             
-            print(f"  ✅ Received response: {len(result_text)} characters")
+        except Exception as e:
+            print(f"❌ Error analyzing drawing: {str(e)}")
+            return {
+                "error": str(e),
+                "problem_identification": "Error occurred",
+                "construction_steps": []
+            }
+    
+    def analyze_section(self, textbook_context: str, problem_number: str) -> Dict:
+        """
+        Generate the canonical solution for a textbook problem (no image)
+        
+        Args:
+            textbook_context: Textbook section text for the problem
+            problem_number: Problem number (e.g., "12-12")
             
-            # Parse JSON response
-            parsed = self._parse_response(result_text)
+        Returns:
+            dict: Analysis results with steps, same shape as analyze_drawing
+        """
+        try:
+            prompt = self._build_canonical_prompt(textbook_context, problem_number)
+            
+            print(f"🤖 Generating canonical analysis for Problem {problem_number}...")
             
-            return parsed
+            return self._generate_analysis([prompt])
             
         except Exception as e:
-            print(f"❌ Error analyzing drawing: {str(e)}")
+            print(f"❌ Error generating canonical analysis: {str(e)}")
             return {
                 "error": str(e),
                 "problem_identification": "Error occurred",
                 "construction_steps": []
             }
     
-    def _build_analysis_prompt(self, textbook_context: str, problem_number: Optional[str]) -> str:
+    def prepare_image(self, image_bytes: bytes):
+        """
+        Decode an upload once for reuse across calls, downscaling oversized images
+        
+        Args:
+            image_bytes: Image file bytes
+            
+        Returns:
+            PIL.Image: Decoded image, at most GEMINI_MAX_IMAGE_DIMENSION px per side
+        """
+        image = self._load_image(image_bytes)
+        image.load()
+        
+        max_dimension = int(os.getenv('GEMINI_MAX_IMAGE_DIMENSION', '2048'))
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension))
+        return image
+    
+    def _load_image(self, image):
+        """Decode image bytes with Pillow (imported lazily); prepared images pass through"""
+        if not isinstance(image, (bytes, bytearray)):
+            return image
+        from PIL import Image
+        return Image.open(io.BytesIO(image))
+    
+    def _build_analysis_prompt(
+        self,
+        textbook_context: str,
+        problem_number: Optional[str],
+        reference_solution: Optional[Dict] = None
+    ) -> str:
         """Build the analysis prompt with textbook context"""
         
         problem_context = f" (Problem {problem_number})" if problem_number else ""
         
+        reference_block = ""
+        if reference_solution:
+            reference_block = f"""
+=== REFERENCE SOLUTION START ===
+A verified solution for this textbook problem. Use it as your starting point and adapt it to what is actually shown in the student's drawing.
+{json.dumps(reference_solution, indent=2)}
+=== REFERENCE SOLUTION END ===
+"""
+        
         prompt = f"""
 You are an expert Engineering Drawing tutor specializing in Projections of Planes{problem_context}.
 
@@ -162,115 +317,121 @@ You are an expert Engineering Drawing tutor specializing in Projections of Plane
 === TEXTBOOK CONTENT START ===
 {textbook_context}
 === TEXTBOOK CONTENT END ===
-
+{reference_block}
 === YOUR TASK ===
 FIRST: Check if this is a valid engineering drawing problem with geometric shapes, projection lines, or technical drawing elements.
 THEN: If valid, analyze this incomplete engineering drawing problem and provide a step-by-step guide to complete it.
 
 Return your response as a JSON object with this EXACT structure:
-{{
-  "problem_identification": "Brief description of what problem this is",
-  "given_information": [
-    "List each piece of given information",
-    "Example: Circular plate 50mm diameter",
-    "Example: Appears as ellipse in front view"
-  ],
-  "required_output": "What needs to be drawn/completed",
-  "key_concept": "Main concept from textbook being applied",
-  "construction_steps": [
-    {{
-      "step": 1,
-      "instruction": "Clear, actionable instruction",
-      "explanation": "Why this step is necessary and what principle applies"
-    }},
-    {{
-      "step": 2,
-      "instruction": "Next instruction",
-      "explanation": "Explanation with reasoning"
-    }}
-    // Continue for 4-6 steps total
-  ],
-  "common_mistakes": [
-    "What students typically get wrong",
-    "Common errors to avoid"
-  ]
-}}
+{ANALYSIS_RESPONSE_FORMAT}
+"""
+        
+        return prompt
+    
+    def _build_canonical_prompt(self, textbook_context: str, problem_number: str) -> str:
+        """Build the text-only prompt for a canonical solution of a textbook problem"""
+        
+        prompt = f"""
+You are an expert Engineering Drawing tutor specializing in Projections of Planes (Problem {problem_number}).
 
-=== GUIDELINES ===
-- Provide 4-6 construction steps (not too few, not too many)
-- Each step must be clear and actionable
-- Use exact terminology from the textbook
-- Be educational and encouraging
-- Reference specific concepts or methods from textbook when relevant
-- Steps should be in logical construction order
+=== CRITICAL INSTRUCTIONS ===
+1. You MUST use ONLY the textbook content provided below to answer
+2. DO NOT use any external knowledge or information not in this textbook
+3. If something is not covered in the textbook, state "Not covered in provided textbook"
+4. Be educational, clear, and encouraging - you're teaching students
 
-IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
+=== TEXTBOOK CONTENT START ===
+{textbook_context}
+=== TEXTBOOK CONTENT END ===
+
+=== YOUR TASK ===
+Write the canonical step-by-step guide for solving Problem {problem_number} exactly as stated in the textbook.
+There is no student drawing; base the solution entirely on the problem statement and method in the textbook.
+
+Return your response as a JSON object with this EXACT structure:
+{ANALYSIS_RESPONSE_FORMAT}
 """
         
         return prompt
     
-    def _parse_response(self, response_text: str) -> Dict:
-        """Parse and validate Gemini JSON response"""
-        try:
-            # Remove any markdown code block formatting
-            cleaned = response_text.strip()
-            if cleaned.startswith('```'):
-                # Remove ```json and ``` markers
-                cleaned = re.sub(r'^```(?:json)?\s*', '', cleaned)
-                cleaned = re.sub(r'\s*```$', '', cleaned)
-            
-            # Parse JSON
-            parsed = json.loads(cleaned)
-            
-            # Check if AI rejected the image as not a drawing
-            if 'error' in parsed and parsed['error'] == 'not_a_drawing':
-                print(f"⚠️  AI rejected: {parsed.get('message', 'Not a valid drawing')}")
-                return parsed
-            
-            # Validate required fields
-            required_fields = ['problem_identification', 'construction_steps']
-            for field in required_fields:
-                if field not in parsed:
-                    print(f"⚠️  Missing required field: {field}")
-                    parsed[field] = "Not provided" if field == 'problem_identification' else []
-            
-            # Validate construction_steps structure
-            if not isinstance(parsed['construction_steps'], list):
-                print("⚠️  construction_steps is not a list")
-                parsed['construction_steps'] = []
-            
-            # Ensure each step has required fields
-            for i, step in enumerate(parsed['construction_steps']):
-                if 'step' not in step:
-                    step['step'] = i + 1
-                if 'instruction' not in step:
-                    step['instruction'] = "Step instruction not provided"
-                if 'explanation' not in step:
-                    step['explanation'] = "Explanation not provided"
-            
-            print(f"  ✅ Parsed {len(parsed['construction_steps'])} construction steps")
-            
-            return parsed
+    def _generate_analysis(self, contents: List) -> Dict:
+        """
+        Run an analysis request and parse the response
+        
+        If the response can't be parsed even after repair, the request is
+        re-asked once, provided the first attempt left enough of the re-ask
+        budget and the client isn't over its token budget.
+        
+        Args:
+            contents: Prompt parts ([prompt] or [prompt, image])
             
-        except json.JSONDecodeError as e:
-            print(f"❌ Failed to parse JSON response: {str(e)}")
-            print(f"  Raw response: {response_text[:200]}...")
-            return {
-                "error": "Failed to parse AI response",
-                "problem_identification": "Parse error",
-                "construction_steps": [],
-                "raw_response": response_text
-            }
+        Returns:
+            dict: Parsed analysis with the model that produced it, or a parse error
+        """
+        started = time.perf_counter()
+        response, model_name = self.analysis_router.generate(contents)
+        result_text = response.text.strip()
+        print(f"  ✅ Received response from {model_name}: {len(result_text)} characters")
+        
+        parsed, outcome = parse_analysis(result_text)
+        reasked = False
+        
+        if parsed is None:
+            elapsed = time.perf_counter() - started
+            if is_downgraded():
+                print("  ⚠️  Not re-asking: client is over its token budget")
+            elif elapsed * 2 > self.reask_budget:
+                print(f"  ⚠️  Not re-asking: first attempt took {elapsed:.1f}s of {self.reask_budget:.0f}s budget")
+            else:
+                print("  🔁 Re-asking for a valid JSON response...")
+                reasked = True
+                response, model_name = self.analysis_router.generate(list(contents) + [REASK_INSTRUCTION])
+                result_text = response.text.strip()
+                parsed, outcome = parse_analysis(result_text)
+                if parsed is not None:
+                    outcome = "reasked"
+        
+        self.parse_stats.record(outcome, reasked)
+        
+        if parsed is None:
+            return self._parse_error(result_text)
+        parsed['model'] = model_name
+        return parsed
+    
+    def _parse_response(self, response_text: str) -> Dict:
+        """Parse and validate Gemini JSON response (repairing truncation)"""
+        parsed, _ = parse_analysis(response_text)
+        return parsed if parsed is not None else self._parse_error(response_text)
+    
+    def _parse_error(self, response_text: str) -> Dict:
+        """Result returned when a response couldn't be parsed"""
+        return {
+            "error": "Failed to parse AI response",
+            "problem_identification": "Parse error",
+            "construction_steps": [],
+            "raw_response": response_text
+        }
+
+
+def _model_list(primary: str, fallbacks: str) -> List[str]:
+    """Primary model followed by comma-separated fallbacks, without duplicates"""
+    models = [primary] + [name.strip() for name in fallbacks.split(',')]
+    return list(dict.fromkeys(name for name in models if name))
 
 
 # Global instance
 _gemini_service = None
+_gemini_service_lock = threading.Lock()
 
 
 def get_gemini_service() -> GeminiService:
     """Get the global Gemini service instance"""
     global _gemini_service
     if _gemini_service is None:
-        _gemini_service = GeminiService()
+        # Startup loads the service in a background thread while requests
+        # may already be arriving, so guard against double initialization
+        with _gemini_service_lock:
+            if _gemini_service is None:
+                _gemini_service = GeminiService()
     return _gemini_service
 
@@ -0,0 +1,112 @@
+"""
+HTTP Cache - ETags, conditional requests and a small analysis result cache
+Responses are serialized with orjson; a GET whose If-None-Match matches
+the current ETag gets a 304 without the work being redone
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson (several times faster than json.dumps)"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def content_key(*parts) -> str:
+    """Stable key (hex digest) for the parts that determine a response's content"""
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def key_etag(key: str) -> str:
+    """
+    ETag for a content key
+
+    Weak, because the same content may be sent gzip-compressed or not.
+    """
+    return f'W/"{key}"'
+
+
+def make_etag(*parts) -> str:
+    """ETag from the parts that determine a response's content"""
+    return key_etag(content_key(*parts))
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match header lists this ETag (or *)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates or "*" in candidates
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response carrying the ETag"""
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def json_with_etag(content, etag: str, status_code: int = 200, headers: Optional[Dict] = None) -> FastJSONResponse:
+    """JSON response carrying an ETag (and any extra headers)"""
+    return FastJSONResponse(content=content, status_code=status_code, headers={"ETag": etag, **(headers or {})})
+
+
+def conditional_json(request: Request, etag: str, build: Callable[[], Dict]) -> Response:
+    """
+    304 if the client already has this ETag, else build the payload and return it
+
+    Args:
+        request: Incoming request (for If-None-Match)
+        etag: ETag of the current representation
+        build: Produces the JSON payload; only called on a cache miss
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return json_with_etag(build(), etag)
+
+
+class ResultCache:
+    """
+    LRU cache of analysis results, keyed by content key
+
+    A repeat upload of the same file is answered without running the
+    pipeline. Entries must not hold per-request metadata (e.g. the upload's
+    filename), since every request with the same content shares them;
+    callers add it back on each hit.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: str, result: Dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Shared by /api/analyze; RESULT_CACHE_SIZE=0 disables it
+result_cache = ResultCache(int(os.getenv('RESULT_CACHE_SIZE', '128')))
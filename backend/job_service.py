@@ -0,0 +1,365 @@
+"""
+Job Service - Asynchronous analysis jobs
+Runs the analysis pipeline on a local worker pool; job state lives in a
+pluggable store (in-memory by default, optional SQLite) with TTL cleanup
+"""
+
+import os
+import contextvars
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from analysis_pipeline import run_upload_pipeline
+
+
+# Job lifecycle: queued -> running -> completed | failed
+TERMINAL_STATUSES = ("completed", "failed")
+
+# SQLite store: how often each worker process heartbeats, and how long without
+# a heartbeat before its in-flight jobs are considered orphaned
+HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '10'))
+OWNER_TIMEOUT_SECONDS = float(os.getenv('JOB_OWNER_TIMEOUT_SECONDS', str(HEARTBEAT_SECONDS * 3)))
+
+
+class JobStore(ABC):
+    """Interface for job state storage"""
+
+    @abstractmethod
+    def create(self, job: Dict) -> None:
+        """Persist a new job"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get a job by ID, or None if unknown or expired"""
+
+    @abstractmethod
+    def update(self, job_id: str, **fields) -> None:
+        """Update fields of an existing job (also bumps updated_at)"""
+
+    @abstractmethod
+    def purge_expired(self, older_than: float) -> int:
+        """Delete finished jobs last updated before `older_than`; returns count"""
+
+    def close(self) -> None:
+        """Release resources held by the store (optional)"""
+
+
+class InMemoryJobStore(JobStore):
+    """Process-local job store (default); jobs are lost on restart"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict) -> None:
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def purge_expired(self, older_than: float) -> int:
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in TERMINAL_STATUSES and job["updated_at"] < older_than
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite-backed job store; results survive restarts and can be shared
+
+    Several worker processes may share one database. Each store registers
+    itself as an owner and heartbeats while alive; in-flight jobs are only
+    failed once their owner has stopped heartbeating, so a worker starting
+    up never fails jobs that another live worker is still running.
+    """
+
+    # Columns returned to callers (the owner is internal bookkeeping)
+    JOB_COLUMNS = "job_id, status, filename, created_at, updated_at, result, error"
+
+    def __init__(
+        self,
+        db_path: str,
+        heartbeat_seconds: float = HEARTBEAT_SECONDS,
+        owner_timeout: float = OWNER_TIMEOUT_SECONDS
+    ):
+        self.db_path = db_path
+        self.heartbeat_seconds = heartbeat_seconds
+        self.owner_timeout = owner_timeout
+        # Unique per store instance, so a reused pid never inherits old jobs
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT
+                )
+            """)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                # Databases created before jobs had owners
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_owners (
+                    owner TEXT PRIMARY KEY,
+                    heartbeat_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_owners (owner, heartbeat_at) VALUES (?, ?)",
+                (self.owner, time.time())
+            )
+
+        self.reap_orphaned()
+
+        self._stop = threading.Event()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop, name="job-store-heartbeat", daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def reap_orphaned(self) -> int:
+        """
+        Fail in-flight jobs whose owning process has stopped heartbeating
+
+        Returns:
+            int: Number of jobs marked failed
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM job_owners WHERE heartbeat_at < ?",
+                (now - self.owner_timeout,)
+            )
+            # Jobs without an owner predate ownership tracking and are orphaned too
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE status IN ('queued', 'running') "
+                "AND (owner IS NULL OR owner NOT IN (SELECT owner FROM job_owners))",
+                ("Interrupted: the worker running this job stopped", now)
+            )
+        if cursor.rowcount:
+            print(f"⚠️  Marked {cursor.rowcount} orphaned jobs as failed")
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Stop heartbeating and deregister, so other workers reap this process's unfinished jobs"""
+        self._stop.set()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM job_owners WHERE owner = ?", (self.owner,))
+
+    def _heartbeat_loop(self):
+        """Refresh this owner's heartbeat until the store is closed"""
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO job_owners (owner, heartbeat_at) VALUES (?, ?)",
+                        (self.owner, time.time())
+                    )
+            except sqlite3.Error as e:
+                print(f"⚠️  Warning: Job store heartbeat failed: {e}")
+
+    def create(self, job: Dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, filename, created_at, updated_at, result, error, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["job_id"], job["status"], job["filename"], job["created_at"],
+                 job["updated_at"], json.dumps(job["result"]), job["error"], self.owner)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self.JOB_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def update(self, job_id: str, **fields) -> None:
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def purge_expired(self, older_than: float) -> int:
+        # Periodic cleanup is also when jobs of workers that died get failed
+        self.reap_orphaned()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+                (older_than,)
+            )
+            return cursor.rowcount
+
+
+class JobService:
+    """Service to queue analysis jobs and run them on a local worker pool"""
+
+    def __init__(self, store: JobStore, max_workers: int = 2, ttl_seconds: float = 3600):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+
+        print(f"✅ Job Service initialized: {type(store).__name__}, "
+              f"{max_workers} workers, TTL {ttl_seconds:.0f}s")
+
+    def submit(
+        self,
+        file_bytes: bytes,
+        content_type: str,
+        filename: str,
+        pages: Optional[str] = None,
+        fresh: bool = False
+    ) -> Dict:
+        """
+        Queue an analysis job
+
+        Args:
+            file_bytes: Uploaded image or PDF file bytes
+            content_type: Upload MIME type
+            filename: Original filename
+            pages: PDF page selection (default first page)
+            fresh: Ignore precomputed analyses
+
+        Returns:
+            dict: The newly created job (status "queued")
+        """
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "filename": filename,
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+            "error": None
+        }
+        self.store.create(job)
+        # Run in a copy of the submitting request's context (client, budget state)
+        self.executor.submit(
+            contextvars.copy_context().run,
+            self._run, job["job_id"], file_bytes, content_type, filename, pages, fresh
+        )
+
+        print(f"📥 Queued job {job['job_id']} for {filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get current job state, or None if unknown or expired"""
+        return self.store.get(job_id)
+
+    def cleanup_expired(self) -> int:
+        """Remove finished jobs older than the TTL"""
+        removed = self.store.purge_expired(time.time() - self.ttl_seconds)
+        if removed:
+            print(f"🧹 Removed {removed} expired jobs")
+        return removed
+
+    def shutdown(self):
+        """Stop accepting work, drop jobs that haven't started yet and close the store"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.store.close()
+
+    def _run(
+        self,
+        job_id: str,
+        file_bytes: bytes,
+        content_type: str,
+        filename: str,
+        pages: Optional[str],
+        fresh: bool
+    ):
+        """Worker: run the pipeline and record the outcome"""
+        self.store.update(job_id, status="running")
+        print(f"\n⚙️  Running job {job_id}")
+
+        try:
+            result = run_upload_pipeline(file_bytes, content_type, filename, pages, fresh)
+            self.store.update(job_id, status="completed", result=result)
+            print(f"✅ Job {job_id} complete!\n")
+        except Exception as e:
+            self.store.update(job_id, status="failed", error=str(e))
+            print(f"❌ Job {job_id} failed: {str(e)}\n")
+
+
+def _create_store() -> JobStore:
+    """Create the job store selected by JOB_STORE (memory | sqlite)"""
+    backend = os.getenv('JOB_STORE', 'memory').lower()
+
+    if backend == 'sqlite':
+        default_path = os.path.join(os.path.dirname(__file__), 'jobs.db')
+        return SQLiteJobStore(os.getenv('JOB_DB_PATH', default_path))
+    if backend != 'memory':
+        print(f"⚠️  Unknown JOB_STORE '{backend}', using in-memory store")
+    return InMemoryJobStore()
+
+
+# Global instance
+_job_service = None
+_job_service_lock = threading.Lock()
+
+
+def get_job_service() -> JobService:
+    """Get the global job service instance"""
+    global _job_service
+    if _job_service is None:
+        with _job_service_lock:
+            if _job_service is None:
+                _job_service = JobService(
+                    _create_store(),
+                    max_workers=int(os.getenv('JOB_WORKERS', '2')),
+                    ttl_seconds=float(os.getenv('JOB_TTL_SECONDS', '3600'))
+                )
+    return _job_service
+
+
+def cleanup_expired_jobs():
+    """Purge expired jobs, if the job service has been started in this process"""
+    if _job_service is not None:
+        _job_service.cleanup_expired()
+
+
+def shutdown_job_service():
+    """Shut down the global job service, if it was ever started"""
+    if _job_service is not None:
+        _job_service.shutdown()
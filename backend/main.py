@@ -3,41 +3,131 @@ Engineering Drawing Mentor - Main FastAPI Application
 Simple, clean implementation for drawing analysis
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import time
+
+# Reference point for startup timing (time-to-startup / time-to-ready)
+_startup_began = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
 import os
 
+import orjson
+
 # Import our services
-from pdf_service import get_pdf_service
+from pdf_service import get_pdf_service, DEFAULT_PDF_PATH
 from gemini_service import get_gemini_service
+from analysis_pipeline import run_upload_pipeline
+from pdf_renderer import get_pdf_renderer, PDFRenderError
+from job_service import get_job_service, cleanup_expired_jobs, shutdown_job_service, TERMINAL_STATUSES
+import speculative_pipeline
+from precompute_service import get_precomputed_mode
+from usage_service import get_usage_service, set_client, is_downgraded, BudgetExceeded
+from http_cache import (
+    FastJSONResponse, content_key, key_etag, make_etag, etag_matches, not_modified,
+    json_with_etag, conditional_json, result_cache
+)
 
 
-# Lifespan event to load PDF at startup
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Load textbook PDF at startup"""
-    print("\n🚀 Starting Engineering Drawing Mentor API...")
-    
-    # Load PDF
-    pdf_service = get_pdf_service()
-    pdf_path = os.path.join(os.path.dirname(__file__), '../TEXTBOOK.pdf')
-    success = pdf_service.load_and_parse(pdf_path)
+# How often expired jobs are purged from the job store
+JOB_CLEANUP_INTERVAL = float(os.getenv('JOB_CLEANUP_INTERVAL', '60'))
+
+# Responses smaller than this many bytes are sent uncompressed
+GZIP_MINIMUM_SIZE = int(os.getenv('GZIP_MINIMUM_SIZE', '1024'))
+
+
+# Startup progress, reported by /livez and /readyz
+startup_state = {
+    "textbook": "pending",  # pending -> loading -> ready | failed
+    "gemini": "pending",
+    "time_to_startup_ms": None,
+    "time_to_ready_ms": None,
+}
+
+
+def _elapsed_ms() -> float:
+    """Milliseconds since this module started importing"""
+    return round((time.perf_counter() - _startup_began) * 1000, 1)
+
+
+def _is_ready() -> bool:
+    """True once the textbook and the Gemini client are both available"""
+    return startup_state["textbook"] == "ready" and startup_state["gemini"] == "ready"
+
+
+def _load_textbook():
+    """Load and parse the textbook PDF (blocking, runs in a worker thread)"""
+    startup_state["textbook"] = "loading"
+    success = get_pdf_service().load_and_parse(DEFAULT_PDF_PATH)
     
-    if not success:
+    if success:
+        startup_state["textbook"] = "ready"
+    else:
+        startup_state["textbook"] = "failed"
         print("⚠️  Warning: Failed to load textbook PDF")
-    
-    # Initialize Gemini service
+
+
+def _load_gemini():
+    """Initialize the Gemini client (blocking, runs in a worker thread)"""
+    startup_state["gemini"] = "loading"
     try:
         get_gemini_service()
-        print("✅ All services initialized!\n")
+        startup_state["gemini"] = "ready"
     except Exception as e:
+        startup_state["gemini"] = "failed"
         print(f"⚠️  Warning: Gemini service initialization failed: {e}\n")
+
+
+async def _load_services():
+    """Load textbook and Gemini client in parallel without blocking the event loop"""
+    await asyncio.gather(
+        asyncio.to_thread(_load_textbook),
+        asyncio.to_thread(_load_gemini),
+    )
+    
+    if _is_ready():
+        startup_state["time_to_ready_ms"] = _elapsed_ms()
+        print(f"✅ All services initialized in {startup_state['time_to_ready_ms']} ms!\n")
+
+
+async def _cleanup_jobs_periodically():
+    """Purge expired jobs from the job store every JOB_CLEANUP_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(JOB_CLEANUP_INTERVAL)
+        try:
+            await asyncio.to_thread(cleanup_expired_jobs)
+        except Exception as e:
+            print(f"⚠️  Warning: Job cleanup failed: {e}")
+
+
+# Lifespan event: start accepting connections right away, load in background
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Kick off textbook and model loading in the background"""
+    print("\n🚀 Starting Engineering Drawing Mentor API...")
+    
+    loader = asyncio.create_task(_load_services())
+    job_cleanup = asyncio.create_task(_cleanup_jobs_periodically())
+    
+    # Startup ends here; the server binds its socket as soon as this yields
+    startup_state["time_to_startup_ms"] = _elapsed_ms()
+    print(f"⚡ Startup complete after {startup_state['time_to_startup_ms']} ms "
+          f"(services loading in background)")
     
     yield
     
-    # Cleanup (if needed)
+    # Cleanup
     print("\n👋 Shutting down...")
+    loader.cancel()
+    job_cleanup.cancel()
+    shutdown_job_service()
+    get_pdf_renderer().shutdown()
 
 
 # Create FastAPI app
@@ -45,7 +135,8 @@ app = FastAPI(
     title="Engineering Drawing Mentor",
     description="AI-powered tutor for engineering drawing problems",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Configure CORS
@@ -55,8 +146,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Content-Location"],
 )
 
+# Compress large payloads (analyses, multi-page results); SSE streams are excluded
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
 
 @app.get("/")
 def root():
@@ -68,93 +163,253 @@ def root():
     }
 
 
+@app.get("/livez")
+def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {
+        "status": "alive",
+        "time_to_startup_ms": startup_state["time_to_startup_ms"]
+    }
+
+
+@app.get("/readyz")
+def readiness_check():
+    """Readiness probe: 200 once textbook and Gemini client are loaded, 503 before"""
+    body = {
+        "status": "ready" if _is_ready() else "starting",
+        "textbook": startup_state["textbook"],
+        "gemini": startup_state["gemini"],
+        "time_to_startup_ms": startup_state["time_to_startup_ms"],
+        "time_to_ready_ms": startup_state["time_to_ready_ms"]
+    }
+    return FastJSONResponse(status_code=200 if _is_ready() else 503, content=body)
+
+
+def _textbook_key() -> str:
+    """Identifies the loaded textbook text (edition and normalization)"""
+    pdf_service = get_pdf_service()
+    if not pdf_service.loaded:
+        return "not-loaded"
+    normalized = pdf_service.index.metadata.get("normalized", False)
+    return f"{pdf_service.textbook_version}{'-normalized' if normalized else ''}"
+
+
+# Health payload per textbook state; it only changes when the textbook loads
+_health_cache: Dict[str, Tuple[str, Dict]] = {}
+
+
+def _health_payload() -> Tuple[str, Dict]:
+    """(ETag, payload) for /api/health, built once per textbook state"""
+    key = _textbook_key()
+    cached = _health_cache.get(key)
+    if cached is None:
+        status = get_pdf_service().get_status()
+        payload = {
+            "status": "healthy",
+            "textbook_loaded": status["loaded"],
+            "total_problems": status["total_problems"],
+            "problem_numbers": status["problem_numbers"],
+            "normalized": status["normalized"],
+            "normalization_savings": status["normalization_savings"]
+        }
+        cached = _health_cache[key] = (make_etag("health", key), payload)
+    return cached
+
+
 @app.get("/api/health")
-def health_check():
+def health_check(request: Request):
     """Health check endpoint with PDF service status"""
-    pdf_service = get_pdf_service()
-    status = pdf_service.get_status()
+    etag, payload = _health_payload()
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return json_with_etag(payload, etag)
+
+
+# Accepted upload types for analysis (images and PDFs)
+VALID_TYPES = ['image/png', 'image/jpeg', 'image/jpg', 'application/pdf']
+
+# How often /api/jobs/{id}/events checks the job store for changes
+JOB_EVENTS_POLL_INTERVAL = 0.5
+
+
+def _validate_upload(file: UploadFile):
+    """Reject uploads that aren't images or PDFs"""
+    if file.content_type not in VALID_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Expected image/PDF, got {file.content_type}"
+        )
+
+
+def _identify_client(request: Request):
+    """
+    Attribute this request's model usage to its client and apply its budget
     
+    The client is the one whose X-API-Key (see CLIENT_API_KEYS) the request
+    carries; requests without a known key count as "anonymous". Raises 429
+    if the client's token budget is used up (or marks the request
+    downgraded, per CLIENT_BUDGET_ACTION).
+    """
+    usage_service = get_usage_service()
+    client_id = usage_service.identify(request.headers.get("x-api-key"))
+    set_client(client_id)
+    try:
+        usage_service.check_budget(client_id)
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+def _require_textbook():
+    """Fail with 503 until background loading of the textbook has finished"""
+    if not get_pdf_service().loaded:
+        detail = ("Service is starting up. Please retry shortly."
+                  if startup_state["textbook"] in ("pending", "loading")
+                  else "Textbook not loaded. Please contact administrator.")
+        raise HTTPException(status_code=503, detail=detail)
+
+
+@app.get("/api/stats/models")
+def model_stats():
+    """Per-stage model routing order and per-model latency/error stats"""
+    if startup_state["gemini"] != "ready":
+        raise HTTPException(status_code=503, detail="Gemini service not initialized")
+    return get_gemini_service().get_model_stats()
+
+
+@app.get("/api/stats/usage")
+def usage_stats():
+    """Token usage and estimated cost by stage, model, problem and client, plus budgets"""
+    return get_usage_service().get_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Token usage and cost counters in Prometheus text format"""
+    return PlainTextResponse(
+        get_usage_service().get_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/stats/textbook")
+def textbook_stats():
+    """Characters and estimated tokens saved by text normalization, overall and per section"""
+    _require_textbook()
+    pdf_service = get_pdf_service()
     return {
-        "status": "healthy",
-        "textbook_loaded": status["loaded"],
-        "total_problems": status["total_problems"],
-        "problem_numbers": status["problem_numbers"]
+        "textbook_version": pdf_service.textbook_version,
+        "normalized": pdf_service.get_status()["normalized"],
+        "normalization": pdf_service.get_normalization_report()
     }
 
 
+@app.get("/api/stats/pipeline")
+def pipeline_stats():
+    """Speculative pipeline branch win rates and extraction deadline misses"""
+    return speculative_pipeline.metrics.to_dict()
+
+
+def _analysis_key(file_bytes: bytes, pages: Optional[str]) -> str:
+    """Result cache key for an upload: same inputs, textbook and model, same result"""
+    model = get_gemini_service().model_name if startup_state["gemini"] == "ready" else None
+    return content_key(
+        "analysis",
+        _textbook_key(),
+        hashlib.sha256(file_bytes).hexdigest(),
+        pages or "",
+        model,
+        get_precomputed_mode(),
+        is_downgraded()
+    )
+
+
+def _is_cacheable(analysis: Dict) -> bool:
+    """Only successful analyses are cached (errors should be retried)"""
+    results = analysis.get("pages", [analysis])
+    return all("error" not in result for result in results)
+
+
+def _without_filename(analysis: Dict) -> Dict:
+    """Copy of an analysis without the uploader's filename, for sharing in the cache"""
+    shared = {key: value for key, value in analysis.items() if key != "filename"}
+    if "pages" in shared:
+        shared["pages"] = [_without_filename(page) for page in shared["pages"]]
+    return shared
+
+
+def _with_filename(analysis: Dict, filename: str) -> Dict:
+    """Copy of a cached analysis carrying this request's filename"""
+    result = {**analysis, "filename": filename}
+    if "pages" in result:
+        result["pages"] = [_with_filename(page, filename) for page in result["pages"]]
+    return result
+
+
+def _analysis_headers(key: str) -> Dict:
+    """Where a cached analysis can be re-fetched (with conditional GETs)"""
+    return {"Content-Location": f"/api/analyses/{key}"}
+
+
 @app.post("/api/analyze")
-async def analyze_drawing(file: UploadFile = File(...)):
+async def analyze_drawing(
+    request: Request,
+    file: UploadFile = File(...),
+    fresh: bool = False,
+    pages: Optional[str] = None
+):
     """
     Analyze uploaded engineering drawing
     
     Process:
+    0. For PDFs, render the selected pages (`pages`, e.g. "2", "1,3" or
+       "all"; default first page) to images
     1. Extract problem number from image
     2. Retrieve relevant textbook section
-    3. Analyze with Gemini AI
+    3. Analyze with Gemini AI (or serve the precomputed analysis;
+       pass `fresh=true` to force a new one)
     4. Return structured steps
+    
+    Repeats of the same upload, page selection, textbook and model are
+    served from a result cache. Cached responses carry an ETag and a
+    Content-Location; re-fetch them with a conditional GET there instead of
+    re-uploading. Fresh analyses are never cached.
     """
     
-    # Validate file type (accept images and PDFs)
-    valid_types = ['image/png', 'image/jpeg', 'image/jpg', 'application/pdf']
-    if file.content_type not in valid_types:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Expected image/PDF, got {file.content_type}"
-        )
+    _validate_upload(file)
+    _identify_client(request)
     
     try:
         # Read file bytes
-        image_bytes = await file.read()
-        print(f"\n📤 Received file: {file.filename} ({len(image_bytes)} bytes)")
-        
-        # Get services
-        pdf_service = get_pdf_service()
-        gemini_service = get_gemini_service()
+        file_bytes = await file.read()
+        print(f"\n📤 Received file: {file.filename} ({len(file_bytes)} bytes)")
         
-        # Check if textbook is loaded
-        if not pdf_service.loaded:
-            raise HTTPException(
-                status_code=503,
-                detail="Textbook not loaded. Please contact administrator."
-            )
+        _require_textbook()
         
-        # Step 1: Extract problem number from image
-        print("📋 Step 1: Extracting problem number...")
-        problem_number = gemini_service.extract_problem_number(image_bytes)
+        key = None
+        if not fresh:
+            key = _analysis_key(file_bytes, pages)
+            cached = result_cache.get(key)
+            if cached is not None:
+                print("✅ Served cached analysis\n")
+                return json_with_etag(_with_filename(cached, file.filename), key_etag(key), headers=_analysis_headers(key))
         
-        # Step 2: Retrieve relevant textbook section
-        print("📖 Step 2: Retrieving textbook section...")
-        if problem_number:
-            textbook_context = pdf_service.get_problem_section(problem_number)
-            if not textbook_context:
-                print(f"  ⚠️  Problem {problem_number} not found, using full text")
-                textbook_context = pdf_service.get_full_text()
-        else:
-            print("  ⚠️  Problem number not detected, using full text")
-            textbook_context = pdf_service.get_full_text()
-            problem_number = None
-        
-        print(f"  ✓ Context size: {len(textbook_context)} characters")
-        
-        # Step 3: Analyze drawing with Gemini
-        print("🤖 Step 3: Analyzing drawing with AI...")
-        analysis = gemini_service.analyze_drawing(
-            image_bytes,
-            textbook_context,
-            problem_number
+        # Run the blocking pipeline off the event loop
+        analysis = await asyncio.to_thread(
+            run_upload_pipeline, file_bytes, file.content_type, file.filename, pages, fresh
         )
         
-        # Add metadata
-        analysis['filename'] = file.filename
-        analysis['detected_problem'] = problem_number
-        analysis['context_used'] = "specific_section" if problem_number else "full_text"
-        
         print("✅ Analysis complete!\n")
         
-        return analysis
+        if key is None or not _is_cacheable(analysis):
+            return FastJSONResponse(content=analysis)
+        
+        result_cache.put(key, _without_filename(analysis))
+        return json_with_etag(analysis, key_etag(key), headers=_analysis_headers(key))
         
     except HTTPException:
         raise
+    except PDFRenderError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ Error: {str(e)}\n")
         raise HTTPException(
@@ -163,6 +418,91 @@ async def analyze_drawing(file: UploadFile = File(...)):
         )
 
 
+@app.get("/api/analyses/{key}")
+def get_cached_analysis(key: str, request: Request):
+    """
+    A cached analysis, by the key in /api/analyze's Content-Location (304 if unchanged)
+    
+    The upload's filename isn't part of the cached result.
+    """
+    cached = result_cache.get(key)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Analysis not found or evicted from the cache")
+    return conditional_json(request, key_etag(key), lambda: cached)
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_analysis_job(
+    request: Request,
+    file: UploadFile = File(...),
+    fresh: bool = False,
+    pages: Optional[str] = None
+):
+    """
+    Queue an analysis job and return immediately
+    
+    Poll `GET /api/jobs/{job_id}` or subscribe to
+    `GET /api/jobs/{job_id}/events` for the result.
+    """
+    
+    _validate_upload(file)
+    _identify_client(request)
+    
+    file_bytes = await file.read()
+    print(f"\n📤 Received file for job: {file.filename} ({len(file_bytes)} bytes)")
+    
+    _require_textbook()
+    
+    job = get_job_service().submit(file_bytes, file.content_type, file.filename, pages, fresh)
+    
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['job_id']}",
+        "events_url": f"/api/jobs/{job['job_id']}/events"
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+def get_analysis_job(job_id: str, request: Request):
+    """Get job status, and the analysis result once completed (304 if unchanged)"""
+    job = get_job_service().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    etag = make_etag("job", job_id, job["status"], job["updated_at"])
+    return conditional_json(request, etag, lambda: job)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str):
+    """
+    Subscribe to job updates as Server-Sent Events
+    
+    Emits a `status` event whenever the job changes state and closes the
+    stream once the job has completed or failed.
+    """
+    # Store reads can block (SQLite lock / busy timeout), so keep them off the event loop
+    job_service = await asyncio.to_thread(get_job_service)
+    if await asyncio.to_thread(job_service.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    
+    async def events():
+        last_status = None
+        while True:
+            job = await asyncio.to_thread(job_service.get, job_id)
+            if job is None:
+                yield "event: error\ndata: {\"detail\": \"Job not found or expired\"}\n\n"
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: status\ndata: {orjson.dumps(job).decode()}\n\n"
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,228 @@
+"""
+Model Router - Latency-aware fallback routing between Gemini models
+Each pipeline stage has an ordered list of candidate models; per-model
+latency and error stats decide which one is tried first
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from usage_service import get_usage_service, is_downgraded
+
+
+# Weight of the newest sample in the latency moving average
+LATENCY_EWMA_ALPHA = 0.3
+
+# After this many consecutive errors a model is benched for COOLDOWN_SECONDS;
+# a model demoted for being slow is re-probed once it has been idle that long
+ERROR_THRESHOLD = 2
+COOLDOWN_SECONDS = 60.0
+
+# Errors that say the model/service is struggling, not that the request is bad;
+# only these fall through to the next model and count against the model.
+# Built on first use: google.api_core pulls in grpc, which `import main` shouldn't pay for
+_transient_errors = None
+
+
+def transient_errors() -> Tuple[type, ...]:
+    """Exception types that trigger fallback to the next model"""
+    global _transient_errors
+    if _transient_errors is None:
+        from google.api_core import exceptions as google_exceptions
+        _transient_errors = (
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.ResourceExhausted,
+            google_exceptions.InternalServerError,
+            ConnectionError,
+            TimeoutError,
+        )
+    return _transient_errors
+
+
+class ModelStats:
+    """Running latency and error stats for one model"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.ewma_latency = None
+        self.last_error = None
+        self.last_error_at = None
+        self.last_call_at = None
+
+    def record_success(self, latency: float):
+        self.calls += 1
+        self.last_call_at = time.time()
+        self.consecutive_errors = 0
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.ewma_latency
+
+    def record_error(self, error: Exception):
+        self.calls += 1
+        self.last_call_at = time.time()
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error = str(error)
+        self.last_error_at = time.time()
+
+    def in_cooldown(self, now: float) -> bool:
+        """True while the model is benched after repeated errors"""
+        return (self.consecutive_errors >= ERROR_THRESHOLD
+                and now - self.last_error_at < COOLDOWN_SECONDS)
+
+    def is_slow(self, latency_budget: float, now: float) -> bool:
+        """True if recent calls averaged over budget (stale averages don't count)"""
+        return (self.ewma_latency is not None
+                and self.ewma_latency > latency_budget
+                and now - self.last_call_at < COOLDOWN_SECONDS)
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.calls, 3) if self.calls else 0.0,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "consecutive_errors": self.consecutive_errors,
+            "in_cooldown": self.in_cooldown(time.time()),
+            "last_error": self.last_error
+        }
+
+
+class ModelRouter:
+    """
+    Routes one pipeline stage's calls across its configured models
+
+    Models are tried in configured order, except that models benched after
+    repeated errors go last, and models whose recent average latency exceeds
+    the stage's latency budget are tried only after models within budget.
+    If a call fails with a transient error, the next model in that order is
+    tried; client errors (bad request, blocked response) are raised at once,
+    since every other model would reject the same request. Requests from
+    clients over budget try the cheapest models first.
+    
+    Every call's token usage and latency is recorded with the usage service.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        models: List[Tuple[str, object]],
+        latency_budget: float,
+        timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            stage: Stage name, used in logs and stats (e.g. "extraction")
+            models: (model_name, GenerativeModel) pairs in preference order
+            latency_budget: Seconds above which a model's average latency
+                demotes it behind faster candidates
+            timeout: Per-request timeout in seconds (None for client default)
+        """
+        if not models:
+            raise ValueError(f"No models configured for stage '{stage}'")
+
+        self.stage = stage
+        self.models = models
+        self.latency_budget = latency_budget
+        self.timeout = timeout
+        self.stats = {name: ModelStats() for name, _ in models}
+        self._lock = threading.Lock()
+
+    @property
+    def primary_model_name(self) -> str:
+        """The preferred (first configured) model"""
+        return self.models[0][0]
+
+    def generate(self, contents) -> Tuple[object, str]:
+        """
+        Call generate_content on the best available model, falling back on errors
+
+        Args:
+            contents: Prompt / [prompt, image] passed to generate_content
+
+        Returns:
+            (response, model_name): Response and the model that produced it
+
+        Raises:
+            Exception: A non-transient error (e.g. InvalidArgument, or
+                ValueError for a blocked/empty response) right away, or the
+                last model's error if every model failed transiently
+        """
+        request_options = {"timeout": self.timeout} if self.timeout else None
+        usage = get_usage_service()
+        last_error = None
+        transient = transient_errors()
+
+        for name, model in self._ordered_models():
+            started = time.perf_counter()
+            try:
+                response = model.generate_content(contents, request_options=request_options)
+            except transient as e:
+                with self._lock:
+                    self.stats[name].record_error(e)
+                usage.record(self.stage, name, latency=time.perf_counter() - started, ok=False)
+                print(f"  ⚠️  {self.stage} call to {name} failed: {str(e)}")
+                last_error = e
+                continue
+            except Exception as e:
+                # The request itself was rejected; the model is fine
+                usage.record(self.stage, name, latency=time.perf_counter() - started, ok=False)
+                print(f"  ❌ {self.stage} call to {name} rejected: {str(e)}")
+                raise
+
+            latency = time.perf_counter() - started
+            try:
+                # Accessing .text raises ValueError if the response was blocked or empty
+                response.text
+            except ValueError as e:
+                # The model answered (and billed the tokens); the content was refused
+                with self._lock:
+                    self.stats[name].record_success(latency)
+                usage.record(self.stage, name, response, latency, ok=False)
+                print(f"  ❌ {self.stage} response from {name} blocked or empty: {str(e)}")
+                raise
+
+            with self._lock:
+                self.stats[name].record_success(latency)
+            usage.record(self.stage, name, response, latency)
+            return response, name
+
+        raise last_error
+
+    def get_stats(self) -> Dict:
+        """Per-model stats and current routing order"""
+        with self._lock:
+            return {
+                "latency_budget_ms": round(self.latency_budget * 1000),
+                "routing_order": [name for name, _ in self._ordered_models()],
+                "models": {name: stats.to_dict() for name, stats in self.stats.items()}
+            }
+
+    def _ordered_models(self) -> List[Tuple[str, object]]:
+        """Candidates in the order they should be tried right now"""
+        now = time.time()
+        within_budget, over_budget, benched = [], [], []
+
+        for name, model in self.models:
+            stats = self.stats[name]
+            if stats.in_cooldown(now):
+                benched.append((name, model))
+            elif stats.is_slow(self.latency_budget, now):
+                over_budget.append((name, model))
+            else:
+                within_budget.append((name, model))
+
+        over_budget.sort(key=lambda candidate: self.stats[candidate[0]].ewma_latency)
+        benched.sort(key=lambda candidate: self.stats[candidate[0]].last_error_at)
+        available = within_budget + over_budget
+
+        if is_downgraded():
+            # Over-budget client: cheapest healthy model first
+            price_rank = get_usage_service().price_rank
+            available.sort(key=lambda candidate: price_rank(candidate[0]))
+        return available + benched
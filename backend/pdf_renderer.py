@@ -0,0 +1,212 @@
+"""
+PDF Renderer - Rasterizes uploaded PDF pages for drawing analysis
+Renders only the requested pages, straight to in-memory PNGs, with an
+LRU cache keyed by content hash so re-uploads skip rasterization
+"""
+
+import io
+import os
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+
+# Render resolution; 150 DPI keeps drawing lines crisp without oversized images
+DEFAULT_DPI = int(os.getenv('PDF_RENDER_DPI', '150'))
+
+# Most pages a single request may fan out to
+MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '10'))
+
+
+class PDFRenderError(ValueError):
+    """Uploaded PDF is unreadable, or the requested pages are invalid"""
+
+
+def _render_page(pdf_bytes: bytes, page_index: int, dpi: int) -> bytes:
+    """Render one page to PNG bytes (runs in-process or in a worker process)"""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        image = pdf[page_index].render(scale=dpi / 72).to_pil()
+    finally:
+        pdf.close()
+
+    out = io.BytesIO()
+    image.save(out, "PNG", optimize=False)
+    return out.getvalue()
+
+
+def parse_page_selection(selection: Optional[str], page_count: int) -> List[int]:
+    """
+    Parse a 1-based page selection into 0-based page indexes
+
+    Args:
+        selection: None (first page), "all", or e.g. "2" / "1,3" / "2-4"
+        page_count: Number of pages in the PDF
+
+    Returns:
+        list: Sorted 0-based page indexes
+
+    Raises:
+        PDFRenderError: If the selection is malformed or out of range
+    """
+    if selection is None or not selection.strip():
+        return [0]
+
+    if selection.strip().lower() == "all":
+        if page_count > MAX_PAGES:
+            raise PDFRenderError(f"Too many pages selected ({page_count}). At most {MAX_PAGES} per request.")
+        return list(range(page_count))
+
+    # Validate every part before expanding anything, so a huge range like
+    # "1-1000000000" is rejected without building it
+    ranges = []
+    try:
+        for part in selection.split(","):
+            if "-" in part:
+                first, last = (int(number) for number in part.split("-", 1))
+            else:
+                first = last = int(part)
+            ranges.append((first, last))
+    except ValueError:
+        raise PDFRenderError(f"Invalid page selection '{selection}'. Use e.g. '2', '1,3', '2-4' or 'all'.")
+
+    for first, last in ranges:
+        if first < 1 or last < first or last > page_count:
+            raise PDFRenderError(
+                f"Page selection '{selection}' out of range; the PDF has {page_count} page(s)."
+            )
+
+    pages = set()
+    for first, last in ranges:
+        if last - first + 1 > MAX_PAGES:
+            pages = None
+            break
+        pages.update(range(first - 1, last))
+        if len(pages) > MAX_PAGES:
+            pages = None
+            break
+    if pages is None:
+        raise PDFRenderError(f"Too many pages selected in '{selection}'. At most {MAX_PAGES} per request.")
+    return sorted(pages)
+
+
+class PDFRenderer:
+    """Renders PDF pages to PNG with a content-hash LRU cache"""
+
+    def __init__(self, cache_size: int = 64, max_workers: Optional[int] = None):
+        self.cache_size = cache_size
+        self.max_workers = max_workers
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # pdfium isn't thread-safe: in-process calls are serialized, and
+        # multi-page fan-out goes to worker processes instead
+        self._pdfium_lock = threading.Lock()
+        self._executor = None
+
+    def page_count(self, pdf_bytes: bytes) -> int:
+        """Number of pages in a PDF"""
+        import pypdfium2 as pdfium
+
+        with self._pdfium_lock:
+            try:
+                pdf = pdfium.PdfDocument(pdf_bytes)
+            except pdfium.PdfiumError as e:
+                raise PDFRenderError(f"Invalid or corrupted PDF file: {str(e)}")
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+
+    def render_pages(self, pdf_bytes: bytes, pages: List[int], dpi: int = DEFAULT_DPI) -> List[bytes]:
+        """
+        Render pages to PNG bytes, reusing cached renders
+
+        Args:
+            pdf_bytes: PDF file content
+            pages: 0-based page indexes
+            dpi: Render resolution
+
+        Returns:
+            list: PNG bytes for each requested page, in the same order
+        """
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        rendered = {}
+
+        with self._cache_lock:
+            for page in pages:
+                key = (digest, page, dpi)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    rendered[page] = self._cache[key]
+
+        missing = [page for page in pages if page not in rendered]
+        if missing:
+            print(f"🖨️  Rendering page(s) {[page + 1 for page in missing]} at {dpi} DPI"
+                  f"{f' ({len(pages) - len(missing)} cached)' if rendered else ''}")
+        elif pages:
+            print(f"🖨️  Using cached render(s) for page(s) {[page + 1 for page in pages]}")
+
+        if len(missing) == 1:
+            # A single page isn't worth the process round trip
+            with self._pdfium_lock:
+                rendered[missing[0]] = _render_page(pdf_bytes, missing[0], dpi)
+        elif missing:
+            try:
+                executor = self._get_executor()
+                images = list(executor.map(_render_page, [pdf_bytes] * len(missing), missing, [dpi] * len(missing)))
+            except BrokenProcessPool as e:
+                # A worker died; start a fresh pool next time and render serially now
+                print(f"⚠️  Render workers failed ({str(e)}), rendering in-process")
+                self.shutdown()
+                with self._pdfium_lock:
+                    images = [_render_page(pdf_bytes, page, dpi) for page in missing]
+            rendered.update(zip(missing, images))
+
+        with self._cache_lock:
+            for page in missing:
+                self._cache[(digest, page, dpi)] = rendered[page]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return [rendered[page] for page in pages]
+
+    def shutdown(self):
+        """Stop the render worker processes, if any were started"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Worker processes, started on first multi-page render"""
+        with self._cache_lock:
+            if self._executor is None:
+                # spawn, not fork: forking a multi-threaded server process is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+
+# Global instance
+_pdf_renderer = None
+_pdf_renderer_lock = threading.Lock()
+
+
+def get_pdf_renderer() -> PDFRenderer:
+    """Get the global PDF renderer instance"""
+    global _pdf_renderer
+    if _pdf_renderer is None:
+        with _pdf_renderer_lock:
+            if _pdf_renderer is None:
+                _pdf_renderer = PDFRenderer(
+                    cache_size=int(os.getenv('PDF_RENDER_CACHE_SIZE', '64')),
+                    max_workers=min(MAX_PAGES, os.cpu_count() or 1)
+                )
+    return _pdf_renderer
@@ -3,25 +3,43 @@ PDF Service - Loads and parses engineering drawing textbook
 Splits textbook into individual problem sections for targeted context retrieval
 """
 
+import io
 import re
-from typing import Dict, Optional
-import PyPDF2
+import hashlib
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
+import text_normalizer
+from textbook_index import TextbookIndex, default_index_path
+
+
+# Textbook shipped at the repository root
+DEFAULT_PDF_PATH = str(Path(__file__).resolve().parent.parent / 'TEXTBOOK.pdf')
+
 
 class PDFService:
     """Service to load and parse PDF textbook into problem sections"""
     
     def __init__(self):
-        self.full_text = ""
+        self.index = None
         self.problem_sections = {}
         self.loaded = False
         self.pdf_path = None
+        self.textbook_version = None
+    
+    @property
+    def full_text(self) -> str:
+        """Full textbook text, decoded from the shared index on each access"""
+        return self.index.full_text() if self.index else ""
         
     def load_and_parse(self, pdf_path: str) -> bool:
         """
         Load PDF and parse into problem sections
         
+        The parsed textbook is kept in a memory-mapped index file shared by
+        every worker process; if another worker already built it for this
+        PDF, it is attached to instead of parsing the PDF again.
+        
         Args:
             pdf_path: Path to PDF file
             
@@ -36,48 +54,122 @@ class PDFService:
                 print(f"❌ PDF file not found: {pdf_path}")
                 return False
             
-            # Extract text from PDF
-            print(f"📖 Loading PDF from: {pdf_path}")
             with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                page_count = len(pdf_reader.pages)
-                print(f"📄 Found {page_count} pages")
-                
-                # Extract text from all pages
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    text = page.extract_text()
-                    self.full_text += text + "\n"
-                    print(f"  ✓ Extracted page {page_num}/{page_count}")
+                pdf_bytes = file.read()
             
-            print(f"✅ Extracted {len(self.full_text)} characters total")
+            # Content hash identifies this edition of the textbook
+            self.textbook_version = hashlib.sha256(pdf_bytes).hexdigest()[:16]
+            normalize = text_normalizer.is_enabled()
+            index_path = default_index_path(self.textbook_version, normalized=normalize)
             
-            # Parse into problem sections
-            self._parse_problem_sections()
+            index = TextbookIndex.attach(index_path, self.textbook_version)
+            if index is not None:
+                print(f"📎 Attached to shared textbook index: {index_path}")
+            else:
+                pages = self._extract_pages(pdf_bytes, pdf_path)
+                full_text, sections, metadata = self._build_sections(pages, normalize)
+                index = TextbookIndex.build(index_path, full_text, sections, self.textbook_version, metadata)
+                print(f"💾 Wrote shared textbook index: {index_path}")
+            
+            self.index = index
+            self.problem_sections = index
             
             self.loaded = True
             print(f"🎯 Successfully parsed {len(self.problem_sections)} problem sections")
+            self._log_normalization_report()
             return True
             
         except Exception as e:
             print(f"❌ Error loading PDF: {str(e)}")
             return False
     
-    def _parse_problem_sections(self):
+    def _extract_pages(self, pdf_bytes: bytes, pdf_path: str) -> List[str]:
+        """Extract the text of each page of the PDF"""
+        # Imported here so the server can start listening before PyPDF2 loads
+        import PyPDF2
+        
+        print(f"📖 Loading PDF from: {pdf_path}")
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        page_count = len(pdf_reader.pages)
+        print(f"📄 Found {page_count} pages")
+        
+        # Extract text from all pages
+        pages = []
+        for page_num, page in enumerate(pdf_reader.pages, 1):
+            pages.append(page.extract_text() + "\n")
+            print(f"  ✓ Extracted page {page_num}/{page_count}")
+        
+        print(f"✅ Extracted {sum(len(page) for page in pages)} characters total")
+        return pages
+    
+    def _build_sections(self, pages: List[str], normalize: bool) -> Tuple[str, Dict[str, Tuple[int, int]], Dict]:
+        """
+        Join extracted pages (normalized if enabled) and parse problem sections
+        
+        Sections are parsed from the normalized text itself, so their offsets
+        always point into the text that is served. If normalization would lose
+        any problem marker, the raw text is used instead.
+        
+        Returns:
+            (full_text, sections, metadata): Text, section spans and index metadata
+        """
+        raw_text = "".join(pages)
+        if not normalize:
+            return raw_text, self._parse_problem_sections(raw_text), {"normalized": False}
+        
+        print("🧹 Normalizing textbook text...")
+        full_text = text_normalizer.normalize_pages(pages)
+        sections = self._parse_problem_sections(full_text)
+        raw_sections = self._parse_problem_sections(raw_text, verbose=False)
+        
+        if sections.keys() != raw_sections.keys():
+            print(f"⚠️  Normalization changed problem markers "
+                  f"({len(raw_sections)} → {len(sections)}), using raw text")
+            return raw_text, raw_sections, {"normalized": False}
+        
+        report = text_normalizer.section_report(raw_text, raw_sections, full_text, sections)
+        return full_text, sections, {"normalized": True, "normalization": report}
+    
+    def _log_normalization_report(self):
+        """Log characters/tokens saved by normalization, overall and per section"""
+        report = self.get_normalization_report()
+        if not report:
+            return
+        
+        total = report["total"]
+        print(f"🧹 Normalization removed {total['chars_saved']} of {total['chars_before']} characters "
+              f"(~{total['tokens_saved']} tokens)")
+        for problem_number, savings in sorted(report["sections"].items()):
+            print(f"  ✓ Problem {problem_number}: {savings['chars_saved']} characters "
+                  f"(~{savings['tokens_saved']} tokens) saved")
+    
+    def _parse_problem_sections(self, full_text: str, verbose: bool = True) -> Dict[str, Tuple[int, int]]:
         """
         Parse full text into individual problem sections
         Uses regex to find "Problem 12-X" markers
+        
+        Args:
+            full_text: Text to parse
+            verbose: Log each section found
+        
+        Returns:
+            dict: Problem number -> (start, end) character offsets into full_text
         """
+        sections = {}
+        
         # Pattern to find problem numbers (e.g., "Problem 12-1", "Problem 12-12")
         problem_pattern = r'Problem\s+12-(\d+)'
         
         # Find all problem numbers
-        matches = list(re.finditer(problem_pattern, self.full_text, re.IGNORECASE))
+        matches = list(re.finditer(problem_pattern, full_text, re.IGNORECASE))
         
         if not matches:
-            print("⚠️  No problem markers found, will use full text as fallback")
-            return
+            if verbose:
+                print("⚠️  No problem markers found, will use full text as fallback")
+            return sections
         
-        print(f"🔍 Found {len(matches)} problem markers")
+        if verbose:
+            print(f"🔍 Found {len(matches)} problem markers")
         
         # Extract sections between problem markers
         for i, match in enumerate(matches):
@@ -88,17 +180,24 @@ class PDFService:
             if i + 1 < len(matches):
                 end_pos = matches[i + 1].start()
             else:
-                end_pos = len(self.full_text)
+                end_pos = len(full_text)
             
-            # Extract section text (include some context before problem statement)
+            # Section span (include some context before problem statement),
+            # trimmed of surrounding whitespace like str.strip()
             context_start = max(0, start_pos - 500)  # Include 500 chars before
-            section_text = self.full_text[context_start:end_pos].strip()
+            while context_start < end_pos and full_text[context_start].isspace():
+                context_start += 1
+            while end_pos > context_start and full_text[end_pos - 1].isspace():
+                end_pos -= 1
             
             # Store in dictionary with key format "12-X"
             key = f"12-{problem_num}"
-            self.problem_sections[key] = section_text
+            sections[key] = (context_start, end_pos)
             
-            print(f"  ✓ Problem {key}: {len(section_text)} characters")
+            if verbose:
+                print(f"  ✓ Problem {key}: {end_pos - context_start} characters")
+        
+        return sections
     
     def get_problem_section(self, problem_number: str) -> Optional[str]:
         """
@@ -110,25 +209,51 @@ class PDFService:
         Returns:
             str: Problem section text, or None if not found
         """
-        # Normalize format (handle both "12-12" and "12.12")
+        return self.problem_sections.get(self.normalize_problem_number(problem_number))
+    
+    def get_problem_section_view(self, problem_number: str) -> Optional[memoryview]:
+        """
+        Zero-copy UTF-8 bytes of a problem section, straight from the shared index
+        
+        Args:
+            problem_number: Problem number (e.g., "12-12" or "12-1")
+            
+        Returns:
+            memoryview: Section bytes, or None if not found
+        """
+        if self.index is None:
+            return None
+        return self.index.view(self.normalize_problem_number(problem_number))
+    
+    def normalize_problem_number(self, problem_number: str) -> str:
+        """Normalize format (handle both "12-12" and "12.12", and bare "12")"""
         normalized = problem_number.replace(".", "-")
         if not normalized.startswith("12-"):
             normalized = f"12-{normalized}"
-        
-        return self.problem_sections.get(normalized)
+        return normalized
     
     def get_full_text(self) -> str:
         """Get full textbook text (fallback when specific problem not found)"""
         return self.full_text
     
+    def get_normalization_report(self) -> Dict:
+        """Characters/tokens removed by text normalization, overall and per section"""
+        if self.index is None:
+            return {}
+        return self.index.metadata.get("normalization", {})
+    
     def get_status(self) -> Dict:
         """Get service status"""
+        metadata = self.index.metadata if self.index else {}
         return {
             "loaded": self.loaded,
             "pdf_path": self.pdf_path,
+            "textbook_version": self.textbook_version,
             "total_problems": len(self.problem_sections),
             "problem_numbers": sorted(self.problem_sections.keys()),
-            "total_characters": len(self.full_text)
+            "total_characters": self.index.total_characters if self.index else 0,
+            "normalized": metadata.get("normalized", False),
+            "normalization_savings": metadata.get("normalization", {}).get("total")
         }
 
 
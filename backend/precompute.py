@@ -0,0 +1,46 @@
+"""
+Precompute canonical analyses for every textbook problem
+
+Usage:
+    python precompute.py                    # all problems missing an analysis
+    python precompute.py --force            # regenerate everything
+    python precompute.py --problem 12-12    # just one (repeatable)
+"""
+
+import argparse
+import sys
+
+from pdf_service import get_pdf_service, DEFAULT_PDF_PATH
+from precompute_service import precompute_all
+from usage_service import get_usage_service, set_client
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Precompute canonical analyses for textbook problems")
+    parser.add_argument("--problem", action="append", dest="problems",
+                        help="Problem number to generate (e.g. 12-12); repeatable, default all")
+    parser.add_argument("--force", action="store_true",
+                        help="Regenerate analyses that already exist")
+    parser.add_argument("--pdf", default=DEFAULT_PDF_PATH,
+                        help="Path to the textbook PDF")
+    args = parser.parse_args()
+
+    pdf_service = get_pdf_service()
+    if not pdf_service.load_and_parse(args.pdf):
+        print("❌ Failed to load textbook PDF")
+        return 1
+
+    print(f"\n📚 Precomputing analyses for textbook version {pdf_service.textbook_version}")
+    set_client("precompute")
+    outcomes = precompute_all(args.problems, force=args.force)
+
+    totals = get_usage_service().get_stats()["totals"]
+    print(f"💰 Used {totals['total_tokens']} tokens (~${totals['cost_usd']:.4f})")
+
+    counts = {outcome: list(outcomes.values()).count(outcome) for outcome in ("generated", "skipped", "failed")}
+    print(f"\n🎯 Done: {counts['generated']} generated, {counts['skipped']} skipped, {counts['failed']} failed")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
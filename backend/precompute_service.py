@@ -0,0 +1,182 @@
+"""
+Precompute Service - Canonical analyses for every known textbook problem
+Generated offline (see precompute.py) and stored on disk, versioned by
+textbook content hash and model name, so /api/analyze can skip the
+expensive analysis call once the problem number is known
+"""
+
+import os
+import re
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from pdf_service import get_pdf_service
+from gemini_service import get_gemini_service
+from usage_service import set_problem
+
+
+# How /api/analyze uses a stored analysis:
+#   serve - return it directly, skipping the analysis call
+#   seed  - pass it to the model as a reference solution
+#   off   - ignore precomputed analyses
+PRECOMPUTED_MODES = ("serve", "seed", "off")
+
+
+class PrecomputeStore:
+    """
+    Directory of canonical analyses:
+    <root>/<textbook_version>/<model_name>/<problem_number>.json
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = Path(root_dir)
+        self._cache = {}  # path -> (mtime_ns, entry)
+        self._lock = threading.Lock()
+
+    def get(self, textbook_version: str, model_name: str, problem_number: str) -> Optional[Dict]:
+        """Get a stored entry, or None if it hasn't been precomputed"""
+        path = self._path(textbook_version, model_name, problem_number)
+
+        # Misses aren't cached and hits are checked against the file's mtime, so
+        # entries written or regenerated later by precompute.py are picked up
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._cache.pop(path, None)
+            return None
+
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached and cached[0] == mtime_ns:
+                return cached[1]
+
+        with open(path, 'r', encoding='utf-8') as file:
+            entry = json.load(file)
+
+        with self._lock:
+            self._cache[path] = (mtime_ns, entry)
+        return entry
+
+    def put(self, textbook_version: str, model_name: str, problem_number: str, analysis: Dict) -> Dict:
+        """Store a canonical analysis (atomically replaces any existing entry)"""
+        path = self._path(textbook_version, model_name, problem_number)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        entry = {
+            "problem_number": problem_number,
+            "textbook_version": textbook_version,
+            "model": model_name,
+            "generated_at": time.time(),
+            "analysis": analysis
+        }
+
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(entry, file, indent=2)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._cache[path] = (path.stat().st_mtime_ns, entry)
+        return entry
+
+    def _path(self, textbook_version: str, model_name: str, problem_number: str) -> Path:
+        """File path for an entry; model names may contain '/' (e.g. "models/...")"""
+        safe_model = re.sub(r'[^A-Za-z0-9._-]', '_', model_name)
+        return self.root_dir / textbook_version / safe_model / f"{problem_number}.json"
+
+
+def get_precomputed_mode() -> str:
+    """Configured PRECOMPUTED_MODE (serve | seed | off)"""
+    mode = os.getenv('PRECOMPUTED_MODE', 'serve').lower()
+    if mode not in PRECOMPUTED_MODES:
+        print(f"⚠️  Unknown PRECOMPUTED_MODE '{mode}', using 'serve'")
+        return "serve"
+    return mode
+
+
+def get_precomputed_analysis(problem_number: str) -> Optional[Dict]:
+    """
+    Get the canonical analysis for a problem under the current textbook and model
+
+    Args:
+        problem_number: Problem number (e.g., "12-12" or "12.12")
+
+    Returns:
+        dict: Stored analysis, or None if not precomputed
+    """
+    pdf_service = get_pdf_service()
+    if not pdf_service.textbook_version:
+        return None
+
+    entry = get_precompute_store().get(
+        pdf_service.textbook_version,
+        get_gemini_service().model_name,
+        pdf_service.normalize_problem_number(problem_number)
+    )
+    return entry["analysis"] if entry else None
+
+
+def precompute_all(problem_numbers: Optional[Iterable[str]] = None, force: bool = False) -> Dict[str, str]:
+    """
+    Generate and store canonical analyses for textbook problems
+
+    Args:
+        problem_numbers: Problems to generate (default: every parsed section)
+        force: Regenerate even if an entry already exists
+
+    Returns:
+        dict: Outcome per problem ("generated", "skipped" or "failed")
+    """
+    pdf_service = get_pdf_service()
+    gemini_service = get_gemini_service()
+    store = get_precompute_store()
+
+    if problem_numbers is None:
+        problem_numbers = sorted(pdf_service.problem_sections.keys())
+
+    outcomes = {}
+    for requested in problem_numbers:
+        # "12.12" or "12" on the command line must be stored as "12-12", the key
+        # /api/analyze looks up
+        problem_number = pdf_service.normalize_problem_number(requested)
+        section = pdf_service.get_problem_section(problem_number)
+        if not section:
+            print(f"  ⚠️  Problem {problem_number} not found in textbook")
+            outcomes[problem_number] = "failed"
+            continue
+
+        existing = store.get(pdf_service.textbook_version, gemini_service.model_name, problem_number)
+        if existing and not force:
+            print(f"  ✓ Problem {problem_number}: already precomputed, skipping")
+            outcomes[problem_number] = "skipped"
+            continue
+
+        set_problem(problem_number)
+        analysis = gemini_service.analyze_section(section, problem_number)
+        if "error" in analysis:
+            print(f"  ❌ Problem {problem_number}: {analysis['error']}")
+            outcomes[problem_number] = "failed"
+            continue
+
+        store.put(pdf_service.textbook_version, gemini_service.model_name, problem_number, analysis)
+        print(f"  ✅ Problem {problem_number}: stored {len(analysis['construction_steps'])} steps")
+        outcomes[problem_number] = "generated"
+
+    return outcomes
+
+
+# Global instance
+_precompute_store = None
+
+
+def get_precompute_store() -> PrecomputeStore:
+    """Get the global precompute store instance"""
+    global _precompute_store
+    if _precompute_store is None:
+        default_dir = os.path.join(os.path.dirname(__file__), 'precomputed')
+        _precompute_store = PrecomputeStore(os.getenv('PRECOMPUTED_DIR', default_dir))
+    return _precompute_store
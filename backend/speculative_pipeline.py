@@ -0,0 +1,214 @@
+"""
+Speculative Pipeline - Overlaps problem-number extraction with local work
+While the Gemini extraction call runs, the image is prepared for analysis
+and a local OCR pass looks for the problem number; if extraction misses
+its deadline, analysis starts with the best locally retrieved context
+"""
+
+import contextvars
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Optional, Tuple
+
+
+# How long to wait for the extraction call before falling back to local results
+DEADLINE_SECONDS = float(os.getenv('SPECULATIVE_DEADLINE_SECONDS', '4'))
+
+# Extra time allowed for local OCR once extraction has missed its deadline
+LOCAL_GRACE_SECONDS = float(os.getenv('SPECULATIVE_LOCAL_GRACE_SECONDS', '1'))
+
+# Which branch decided the textbook context
+BRANCHES = ("extraction", "local", "full_text")
+
+
+def is_enabled() -> bool:
+    """Speculative mode is opt-in via SPECULATIVE_PIPELINE=true"""
+    return os.getenv('SPECULATIVE_PIPELINE', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+
+class SpeculativeMetrics:
+    """Counts of which branch won, and how often extraction missed its deadline"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.wins = {branch: 0 for branch in BRANCHES}
+        self.deadline_missed = 0
+        self.local_candidates = 0
+        self.local_agreed = 0
+
+    def record(self, branch: str, deadline_missed: bool, local_number: Optional[str], extracted: Optional[str]):
+        with self._lock:
+            self.requests += 1
+            self.wins[branch] += 1
+            self.deadline_missed += deadline_missed
+            if local_number:
+                self.local_candidates += 1
+                self.local_agreed += local_number == extracted
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": is_enabled(),
+                "deadline_seconds": DEADLINE_SECONDS,
+                "requests": self.requests,
+                "wins": dict(self.wins),
+                "win_rate": {
+                    branch: round(count / self.requests, 3) if self.requests else 0.0
+                    for branch, count in self.wins.items()
+                },
+                "deadline_missed": self.deadline_missed,
+                "local_candidates": self.local_candidates,
+                # How often local OCR matched the model, when both produced a number
+                "local_agreed": self.local_agreed
+            }
+
+
+metrics = SpeculativeMetrics()
+
+# Shared pool for local OCR only (CPU-bound). Extraction never queues here:
+# each request starts its own extraction thread, so the deadline only ever
+# measures model latency, not time spent waiting behind other requests' OCR
+_ocr_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('SPECULATIVE_OCR_WORKERS', str(os.cpu_count() or 2))),
+    thread_name_prefix="speculative-ocr"
+)
+
+
+def retrieve_local_candidate(image_bytes: bytes, known_problems) -> Optional[str]:
+    """
+    Find the problem number locally with Tesseract OCR
+
+    Args:
+        image_bytes: Image file bytes
+        known_problems: Problem numbers present in the textbook
+
+    Returns:
+        str: Problem number (e.g., "12-12") that exists in the textbook, or None
+    """
+    try:
+        import pytesseract
+        from PIL import Image
+        import io
+
+        image = Image.open(io.BytesIO(image_bytes)).convert("L")
+        text = pytesseract.image_to_string(image)
+    except Exception as e:
+        print(f"  ⚠️  Local OCR unavailable: {str(e)}")
+        return None
+
+    for match in re.finditer(r'12\s*[-.–]\s*(\d+)', text):
+        candidate = f"12-{match.group(1)}"
+        if candidate in known_problems:
+            print(f"  🔎 Local OCR candidate: {candidate}")
+            return candidate
+    return None
+
+
+def resolve_problem_number(gemini_service, pdf_service, image_bytes: bytes) -> Tuple[Optional[str], object, str]:
+    """
+    Run extraction, local retrieval and image preparation concurrently
+
+    Args:
+        gemini_service: GeminiService used for extraction and image preparation
+        pdf_service: PDFService providing the known problem numbers
+        image_bytes: Uploaded image file bytes
+
+    Returns:
+        (problem_number, prepared_image, branch): The problem number to use
+        (or None for full text), the decoded image for analysis, and which
+        branch decided ("extraction", "local" or "full_text")
+    """
+    started = time.perf_counter()
+
+    # Extraction gets its own thread, in a copy of the request context so its
+    # usage is attributed; an abandoned call finishes there in the background
+    # (bounded by the extraction timeout)
+    extraction = _start_thread(
+        contextvars.copy_context().run, gemini_service.extract_problem_number, image_bytes
+    )
+    local = _ocr_executor.submit(_local_unless_extracted, extraction, image_bytes, pdf_service.problem_sections)
+
+    # Preparation is local and fast: do it on this thread while extraction runs,
+    # falling back to raw bytes if it fails
+    try:
+        image = gemini_service.prepare_image(image_bytes)
+    except Exception as e:
+        print(f"  ⚠️  Image preparation failed: {str(e)}")
+        image = image_bytes
+
+    deadline_missed = False
+    extracted = None
+    try:
+        extracted = extraction.result(timeout=max(0.0, DEADLINE_SECONDS - (time.perf_counter() - started)))
+    except TimeoutError:
+        deadline_missed = True
+        print(f"  ⏰ Extraction missed {DEADLINE_SECONDS}s deadline, using local retrieval")
+        _abandon(extraction)
+
+    if extracted:
+        local_number = _cancel_or_peek(local)
+        branch = "extraction"
+        problem_number = extracted
+    else:
+        # Extraction missed the deadline or found nothing: use the local candidate
+        remaining = LOCAL_GRACE_SECONDS if deadline_missed else DEADLINE_SECONDS
+        try:
+            local_number = local.result(timeout=remaining)
+        except TimeoutError:
+            _abandon(local)
+            local_number = None
+        branch = "local" if local_number else "full_text"
+        problem_number = local_number
+
+    metrics.record(branch, deadline_missed, local_number, extracted)
+    print(f"  🏁 Speculative branch '{branch}' won after {time.perf_counter() - started:.2f}s")
+    return problem_number, image, branch
+
+
+def _start_thread(fn, *args) -> Future:
+    """Run fn(*args) on a new daemon thread, returning a Future for its result"""
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="speculative-extraction", daemon=True).start()
+    return future
+
+
+def _local_unless_extracted(extraction: Future, image_bytes: bytes, known_problems) -> Optional[str]:
+    """Local OCR, skipped if extraction already produced a number while this waited in the queue"""
+    if extraction.done() and not extraction.exception() and extraction.result():
+        return None
+    return retrieve_local_candidate(image_bytes, known_problems)
+
+
+def _cancel_or_peek(future: Future) -> Optional[str]:
+    """Result of a finished future, else cancel it (or let it finish unobserved)"""
+    if future.done():
+        try:
+            return future.result()
+        except Exception:
+            return None
+    _abandon(future)
+    return None
+
+
+def _abandon(future: Future):
+    """Cancel losing work; if already running, let it finish and drop the result"""
+    if not future.cancel():
+        # Consume the outcome so errors in abandoned work aren't silently lost
+        future.add_done_callback(_log_abandoned_error)
+
+
+def _log_abandoned_error(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"  ⚠️  Abandoned speculative task failed: {future.exception()}")
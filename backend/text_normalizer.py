@@ -0,0 +1,148 @@
+"""
+Text Normalizer - Strips PDF extraction noise from the textbook text
+Removes running headers/footers and page numbers that repeat across pages,
+re-joins words hyphenated across line breaks and collapses whitespace, so
+every textbook_context sent to the model carries less boilerplate
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+
+# Lines that start a problem section must never be dropped as boilerplate
+PROBLEM_MARKER = re.compile(r'Problem\s+12-(\d+)', re.IGNORECASE)
+
+# Only the first/last few lines of a page are considered header/footer candidates
+EDGE_LINES = 3
+
+# A page-edge line is boilerplate once its shape repeats on this many pages
+MIN_REPEATS = 3
+
+# Running headers are titles whose page numbers vary ("# Engineering Drawing
+# [Ch. #"); figure labels and captions ("a", "FIG. #-#") also recur at page
+# edges but are content, so varying lines need this many words to qualify
+# (lines repeated verbatim, like "Chapter 12", need one)
+MIN_HEADER_WORDS = 2
+
+_DIGITS = re.compile(r'\d+')
+_WORD = re.compile(r'[A-Za-z]{3,}')
+_PAGE_NUMBER = re.compile(r'^(page\s*)?\d{1,4}$', re.IGNORECASE)
+_HYPHEN_BREAK = re.compile(r'([A-Za-z])-[ \t]*\n[ \t]*([a-z])')
+_INLINE_SPACE = re.compile(r'[ \t\f\v\u00a0]+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def is_enabled() -> bool:
+    """Normalization is on by default; TEXTBOOK_NORMALIZE=false keeps the raw text"""
+    return os.getenv('TEXTBOOK_NORMALIZE', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return math.ceil(len(text) / 4)
+
+
+def normalize_pages(pages: List[str]) -> str:
+    """
+    Normalize extracted page texts into a single cleaned text
+
+    Args:
+        pages: Text of each PDF page, in order
+
+    Returns:
+        str: Cleaned full text, pages separated by a newline
+    """
+    page_lines = [[line.strip() for line in page.splitlines()] for page in pages]
+    boilerplate = _find_boilerplate(page_lines)
+
+    cleaned_pages = []
+    for lines in page_lines:
+        kept = [
+            line for number, line in enumerate(lines)
+            if not (_is_edge(number, len(lines)) and _is_boilerplate(line, boilerplate))
+        ]
+        cleaned_pages.append("\n".join(kept))
+
+    text = "\n".join(cleaned_pages) + "\n"
+    text = _HYPHEN_BREAK.sub(r'\1\2', text)
+    text = _INLINE_SPACE.sub(' ', text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text)
+
+
+def section_report(
+    raw_text: str,
+    raw_sections: Dict[str, Tuple[int, int]],
+    text: str,
+    sections: Dict[str, Tuple[int, int]]
+) -> Dict:
+    """
+    Characters and estimated tokens saved, overall and per problem section
+
+    Args:
+        raw_text / raw_sections: Text and section spans before normalization
+        text / sections: Text and section spans after normalization
+
+    Returns:
+        dict: {"total": {...}, "sections": {problem: {...}}}
+    """
+    def savings(before: str, after: str) -> Dict:
+        return {
+            "chars_before": len(before),
+            "chars_after": len(after),
+            "chars_saved": len(before) - len(after),
+            "tokens_saved": estimate_tokens(before) - estimate_tokens(after)
+        }
+
+    return {
+        "total": savings(raw_text, text),
+        "sections": {
+            key: savings(raw_text[slice(*raw_sections[key])], text[slice(*sections[key])])
+            for key in sections if key in raw_sections
+        }
+    }
+
+
+def _find_boilerplate(page_lines: List[List[str]]) -> set:
+    """Keys of page-edge lines that repeat across enough pages"""
+    # A line repeated on every page of a short document still counts
+    min_repeats = min(MIN_REPEATS, len(page_lines))
+    if min_repeats < 2:
+        return set()
+
+    counts = Counter()
+    for lines in page_lines:
+        edge_keys = {
+            _boilerplate_key(line) for number, line in enumerate(lines)
+            if _is_edge(number, len(lines))
+        }
+        edge_keys.discard(None)
+        counts.update(edge_keys)
+
+    return {key for key, count in counts.items() if count >= min_repeats}
+
+
+def _boilerplate_key(line: str):
+    """What a header/footer candidate must repeat as, or None if it can't be one"""
+    if PROBLEM_MARKER.search(line):
+        return None
+    words = len(_WORD.findall(line))
+    if words >= MIN_HEADER_WORDS:
+        # Digits masked, so "256 Engineering Drawing" matches "258 ..."
+        return ("shape", _DIGITS.sub('#', line))
+    if words:
+        return ("exact", line)
+    return None
+
+
+def _is_boilerplate(line: str, boilerplate: set) -> bool:
+    if not line or PROBLEM_MARKER.search(line):
+        return False
+    return bool(_PAGE_NUMBER.match(line)) or _boilerplate_key(line) in boilerplate
+
+
+def _is_edge(number: int, line_count: int) -> bool:
+    return number < EDGE_LINES or number >= line_count - EDGE_LINES
@@ -0,0 +1,206 @@
+"""
+Textbook Index - Parsed textbook in a compact, read-only, memory-mapped file
+The text is stored once as UTF-8 and sections are (start, end) byte offsets
+into it, so every uvicorn/gunicorn worker maps the same pages instead of
+holding its own copy of the full text and of every section
+"""
+
+import os
+import json
+import mmap
+import struct
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# File layout: MAGIC | header length (uint32 LE) | JSON header | UTF-8 text
+MAGIC = b"EDMTIDX1"
+_HEADER_LENGTH = struct.Struct("<I")
+
+# Bump when the layout or the parsing that feeds it changes
+INDEX_FORMAT_VERSION = 1
+
+
+def default_index_path(textbook_version: str, normalized: bool = False) -> str:
+    """
+    Location of the index file for a textbook version
+
+    Uses TEXTBOOK_INDEX_DIR if set, else /dev/shm (RAM-backed and shared
+    between processes on Linux), else the system temp directory. Raw and
+    normalized text get separate files, so toggling normalization never
+    attaches to an index built the other way.
+    """
+    index_dir = os.getenv('TEXTBOOK_INDEX_DIR')
+    if not index_dir:
+        index_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    variant = "-normalized" if normalized else ""
+    filename = f"edm-textbook-{textbook_version}{variant}-v{INDEX_FORMAT_VERSION}.idx"
+    return os.path.join(index_dir, filename)
+
+
+class TextbookIndex(Mapping):
+    """
+    Read-only view of an index file, usable as a dict of problem -> section text
+
+    Lookups through the Mapping interface decode only the requested section;
+    `view()` returns a zero-copy memoryview of its UTF-8 bytes instead.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buffer = memoryview(self._mmap)
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            buffer.release()
+            self._mmap.close()
+            raise ValueError(f"Not a textbook index file: {path}")
+
+        header_start = len(MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack_from(buffer, len(MAGIC))
+        header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+
+        self.textbook_version = header["textbook_version"]
+        self.total_characters = header["total_characters"]
+        self.metadata = header.get("metadata", {})
+        self._sections = {key: tuple(span) for key, span in header["sections"].items()}
+        self._text = buffer[header_start + header_length:]
+        buffer.release()
+
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        text: str,
+        sections: Dict[str, Tuple[int, int]],
+        textbook_version: str,
+        metadata: Optional[Dict] = None
+    ) -> "TextbookIndex":
+        """
+        Write an index file (if no other process has yet) and attach to it
+
+        Args:
+            path: Destination index file
+            text: Full textbook text
+            sections: Problem number -> (start, end) character offsets into `text`
+            textbook_version: Content hash of the source PDF
+            metadata: Extra JSON-serializable information to keep in the header
+
+        Returns:
+            TextbookIndex: Attached index
+        """
+        text_bytes = text.encode("utf-8")
+        byte_offsets = _char_to_byte_offsets(text, [pos for span in sections.values() for pos in span])
+
+        header = json.dumps({
+            "textbook_version": textbook_version,
+            "total_characters": len(text),
+            "metadata": metadata or {},
+            "sections": {
+                key: [byte_offsets[start], byte_offsets[end]]
+                for key, (start, end) in sections.items()
+            }
+        }).encode("utf-8")
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(MAGIC)
+            file.write(_HEADER_LENGTH.pack(len(header)))
+            file.write(header)
+            file.write(text_bytes)
+
+        # Publish with link() rather than replace() so that when several workers
+        # race, they all end up mapping the same file instead of one copy each
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+        return cls(path)
+
+    @classmethod
+    def attach(cls, path: str, textbook_version: str) -> Optional["TextbookIndex"]:
+        """
+        Attach to an existing index file for this textbook version
+
+        Returns:
+            TextbookIndex, or None if the file is missing or unusable
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            index = cls(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Ignoring unreadable textbook index {path}: {e}")
+            return None
+
+        if index.textbook_version != textbook_version:
+            index.close()
+            return None
+        return index
+
+    def view(self, key: str) -> Optional[memoryview]:
+        """
+        Zero-copy UTF-8 bytes of a section, or None if unknown
+
+        The view pins the mapping: release it (or use it in a `with` block)
+        before calling close(), or the mapping stays open until it is.
+        """
+        span = self._sections.get(key)
+        if span is None:
+            return None
+        return self._text[span[0]:span[1]]
+
+    def text_view(self) -> memoryview:
+        """Zero-copy UTF-8 bytes of the full text (pins the mapping like view())"""
+        return self._text
+
+    def full_text(self) -> str:
+        """Decode the full text (allocates a new string)"""
+        return str(self._text, "utf-8")
+
+    def close(self):
+        """
+        Release the mapping
+
+        If views returned by view()/text_view() are still alive the mapping
+        can't be unmapped yet; it is then left to be freed once the last
+        view is released, instead of raising.
+        """
+        try:
+            self._text.release()
+            self._mmap.close()
+        except BufferError:
+            print(f"⚠️  Textbook index {self.path} still has live views; unmapping when they are released")
+
+    def __getitem__(self, key: str) -> str:
+        start, end = self._sections[key]
+        return str(self._text[start:end], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sections)
+
+    def __len__(self) -> int:
+        return len(self._sections)
+
+
+def _char_to_byte_offsets(text: str, positions: List[int]) -> Dict[int, int]:
+    """Map character offsets in `text` to byte offsets in its UTF-8 encoding"""
+    offsets = {}
+    byte_pos = 0
+    char_pos = 0
+
+    for pos in sorted(set(positions)):
+        byte_pos += len(text[char_pos:pos].encode("utf-8"))
+        char_pos = pos
+        offsets[pos] = byte_pos
+
+    return offsets
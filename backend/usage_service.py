@@ -0,0 +1,429 @@
+"""
+Usage Service - Token and cost accounting for every Gemini call
+Calls are attributed to the pipeline stage, the problem number and the API
+client of the request that made them (carried in context variables), and
+per-client token budgets can reject or downgrade further requests
+"""
+
+import contextvars
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+# Client for requests without a known API key (and calls outside any request)
+ANONYMOUS = "anonymous"
+
+# Request attribution; set per request and copied into worker threads
+# (asyncio.to_thread copies automatically, executors need copy_context())
+client_var = contextvars.ContextVar("usage_client", default=ANONYMOUS)
+problem_var = contextvars.ContextVar("usage_problem", default=None)
+downgraded_var = contextvars.ContextVar("usage_downgraded", default=False)
+
+# Label for calls made before the problem number is known (e.g. extraction)
+UNATTRIBUTED = "unidentified"
+
+# USD per 1M tokens (prompt, output); override or extend with
+# GEMINI_PRICES="model=prompt/output,..." e.g. "gemini-2.0-flash=0.10/0.40"
+DEFAULT_PRICES = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+# What happens once a client exceeds its budget
+BUDGET_ACTIONS = ("reject", "downgrade")
+
+
+class BudgetExceeded(Exception):
+    """Client has used up its token budget for the current window"""
+
+
+def set_client(client_id: str):
+    """Attribute calls made in the current context to this API client"""
+    client_var.set(client_id or ANONYMOUS)
+
+
+def set_problem(problem_number: Optional[str]):
+    """Attribute further calls in the current context to this problem"""
+    problem_var.set(problem_number)
+
+
+def is_downgraded() -> bool:
+    """True if the current request should use the cheapest models available"""
+    return downgraded_var.get()
+
+
+def _parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "model=prompt/output,..." price overrides"""
+    prices = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            model, rates = entry.split("=", 1)
+            prompt_rate, output_rate = rates.split("/", 1)
+            prices[model.strip()] = (float(prompt_rate), float(output_rate))
+        except ValueError:
+            print(f"⚠️  Ignoring malformed GEMINI_PRICES entry '{entry}'")
+    return prices
+
+
+def _hash_key(api_key: str) -> str:
+    """Digest of an API key, so keys aren't held or compared in plain text"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _parse_client_keys(spec: str) -> Dict[str, str]:
+    """Parse "client=api_key,..." into API key digest -> client id"""
+    clients = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            client, api_key = entry.split("=", 1)
+        except ValueError:
+            print("⚠️  Ignoring malformed CLIENT_API_KEYS entry")
+            continue
+        if client.strip() and api_key.strip():
+            clients[_hash_key(api_key.strip())] = client.strip()
+    return clients
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    """Parse "client=tokens,..." per-client budget overrides"""
+    budgets = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            client, tokens = entry.rsplit("=", 1)
+            budgets[client.strip()] = int(tokens)
+        except ValueError:
+            print(f"⚠️  Ignoring malformed CLIENT_TOKEN_BUDGETS entry '{entry}'")
+    return budgets
+
+
+class UsageTotals:
+    """Running totals for one group of calls"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.latency_seconds = 0.0
+
+    def add(self, prompt_tokens: int, output_tokens: int, cost_usd: float, latency: float, ok: bool):
+        self.calls += 1
+        self.errors += not ok
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += cost_usd
+        self.latency_seconds += latency
+
+    def merge(self, other: "UsageTotals"):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.prompt_tokens += other.prompt_tokens
+        self.output_tokens += other.output_tokens
+        self.cost_usd += other.cost_usd
+        self.latency_seconds += other.latency_seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.prompt_tokens + self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "avg_latency_ms": round(self.latency_seconds / self.calls * 1000, 1) if self.calls else None
+        }
+
+
+class UsageLedger:
+    """Append-only SQLite log of every call, for auditing and budgets across workers"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage (
+                    ts REAL NOT NULL,
+                    client TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    problem TEXT,
+                    model TEXT NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    output_tokens INTEGER NOT NULL,
+                    latency_ms REAL NOT NULL,
+                    cost_usd REAL NOT NULL,
+                    ok INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS usage_client_ts ON usage (client, ts)")
+
+    def append(self, row: Tuple):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+    def tokens_since(self, client: str, since: float) -> int:
+        """Tokens a client has used since a timestamp"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + output_tokens), 0) FROM usage "
+                "WHERE client = ? AND ts >= ?",
+                (client, since)
+            ).fetchone()
+        return row[0]
+
+
+class UsageService:
+    """Aggregates per-call usage and enforces per-client token budgets"""
+
+    def __init__(
+        self,
+        prices: Dict[str, Tuple[float, float]],
+        ledger: Optional[UsageLedger] = None,
+        default_budget: int = 0,
+        client_budgets: Optional[Dict[str, int]] = None,
+        budget_window: float = 86400,
+        budget_action: str = "reject",
+        client_keys: Optional[Dict[str, str]] = None
+    ):
+        """
+        Args:
+            prices: Model -> (prompt, output) USD per 1M tokens
+            ledger: Optional SQLite ledger every call is written to
+            default_budget: Tokens per client per window (0 = unlimited)
+            client_budgets: Per-client overrides of default_budget
+            budget_window: Budget window length in seconds
+            budget_action: "reject" or "downgrade" once a budget is used up
+            client_keys: API key digest -> client id of the known clients
+        """
+        self.prices = prices
+        self.ledger = ledger
+        self.default_budget = default_budget
+        self.client_budgets = client_budgets or {}
+        self.budget_window = budget_window
+        self.budget_action = budget_action
+        self.client_keys = client_keys or {}
+
+        # (stage, model, problem, client) -> totals; views group these on demand
+        self._totals: Dict[Tuple[str, str, str, str], UsageTotals] = {}
+        # client -> (window start, tokens used in that window)
+        self._window_usage: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def cost(self, model: str, prompt_tokens: int, output_tokens: int) -> float:
+        """USD cost of a call (0 for models without a known price)"""
+        prompt_rate, output_rate = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_rate + output_tokens * output_rate) / 1_000_000
+
+    def price_rank(self, model: str) -> float:
+        """Sort key for cheapest-first routing; unpriced models sort last"""
+        if model not in self.prices:
+            return float("inf")
+        return sum(self.prices[model])
+
+    def record(self, stage: str, model: str, response=None, latency: float = 0.0, ok: bool = True):
+        """
+        Record one model call, attributed to the current request context
+
+        Args:
+            stage: Pipeline stage (e.g. "extraction", "analysis")
+            model: Model that served (or failed) the call
+            response: generate_content response carrying usage_metadata
+            latency: Call duration in seconds
+            ok: False if the call failed
+        """
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        cost = self.cost(model, prompt_tokens, output_tokens)
+
+        client = client_var.get()
+        problem = problem_var.get() or UNATTRIBUTED
+        now = time.time()
+
+        with self._lock:
+            key = (stage, model, problem, client)
+            if key not in self._totals:
+                self._totals[key] = UsageTotals()
+            self._totals[key].add(prompt_tokens, output_tokens, cost, latency, ok)
+
+            window_start = self._window_start(now)
+            started, used = self._window_usage.get(client, (window_start, 0))
+            if started != window_start:
+                used = 0
+            self._window_usage[client] = (window_start, used + prompt_tokens + output_tokens)
+
+        if self.ledger is not None:
+            try:
+                self.ledger.append((now, client, stage, problem, model, prompt_tokens,
+                                    output_tokens, round(latency * 1000, 1), cost, int(ok)))
+            except sqlite3.Error as e:
+                print(f"⚠️  Failed to write usage ledger: {str(e)}")
+
+    def identify(self, api_key: Optional[str]) -> str:
+        """
+        Client id for a request's API key
+
+        Identity comes only from configured keys, never from a name the
+        client picks, so a client can't reset its budget by renaming itself.
+        Requests without a known key share one "anonymous" client, which
+        also keeps the number of per-client series bounded.
+        """
+        if not api_key:
+            return ANONYMOUS
+        return self.client_keys.get(_hash_key(api_key), ANONYMOUS)
+
+    def budget_for(self, client: str) -> int:
+        """Token budget per window for a client (0 = unlimited)"""
+        return self.client_budgets.get(client, self.default_budget)
+
+    def tokens_used(self, client: str) -> int:
+        """Tokens a client has used in the current budget window"""
+        window_start = self._window_start(time.time())
+        if self.ledger is not None:
+            # The ledger sees calls from every worker process
+            return self.ledger.tokens_since(client, window_start)
+        with self._lock:
+            started, used = self._window_usage.get(client, (window_start, 0))
+        return used if started == window_start else 0
+
+    def check_budget(self, client: str) -> bool:
+        """
+        Apply the client's budget to the current request
+
+        Returns:
+            bool: True if the request proceeds downgraded
+
+        Raises:
+            BudgetExceeded: If the budget is used up and the action is "reject"
+        """
+        budget = self.budget_for(client)
+        if budget <= 0:
+            return False
+
+        used = self.tokens_used(client)
+        if used < budget:
+            return False
+
+        if self.budget_action == "downgrade":
+            print(f"  💸 Client '{client}' over budget ({used}/{budget} tokens), downgrading")
+            downgraded_var.set(True)
+            return True
+
+        resets_in = self._window_start(time.time()) + self.budget_window - time.time()
+        raise BudgetExceeded(
+            f"Token budget exceeded ({used}/{budget} tokens); resets in {resets_in:.0f}s"
+        )
+
+    def get_stats(self) -> Dict:
+        """Usage totals overall and grouped by stage, model, problem and client"""
+        with self._lock:
+            entries = list(self._totals.items())
+
+        def group(position: Optional[int]) -> Dict:
+            grouped = {}
+            for key, totals in entries:
+                name = key[position] if position is not None else "all"
+                grouped.setdefault(name, UsageTotals()).merge(totals)
+            return {name: totals.to_dict() for name, totals in sorted(grouped.items())}
+
+        clients = sorted({key[3] for key, _ in entries} | set(self.client_budgets))
+        return {
+            "totals": group(None).get("all", UsageTotals().to_dict()),
+            "by_stage": group(0),
+            "by_model": group(1),
+            "by_problem": group(2),
+            "by_client": group(3),
+            "budgets": {
+                "action": self.budget_action,
+                "window_seconds": self.budget_window,
+                "clients": {
+                    client: {"used": self.tokens_used(client), "budget": self.budget_for(client)}
+                    for client in clients if self.budget_for(client) > 0
+                }
+            },
+            "ledger": self.ledger.db_path if self.ledger else None
+        }
+
+    def get_metrics(self) -> str:
+        """Totals in Prometheus text exposition format"""
+        with self._lock:
+            entries = list(self._totals.items())
+
+        counters = [
+            ("calls_total", "Gemini calls", lambda t: t.calls),
+            ("errors_total", "Failed Gemini calls", lambda t: t.errors),
+            ("prompt_tokens_total", "Prompt tokens sent to Gemini", lambda t: t.prompt_tokens),
+            ("output_tokens_total", "Output tokens generated by Gemini", lambda t: t.output_tokens),
+            ("cost_usd_total", "Estimated Gemini cost in USD", lambda t: t.cost_usd),
+            ("latency_seconds_total", "Total Gemini call latency in seconds", lambda t: t.latency_seconds),
+        ]
+        labels = ("stage", "model", "problem", "client")
+
+        lines = []
+        for name, help_text, value in counters:
+            metric = f"edm_gemini_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for key, totals in entries:
+                label_text = ",".join(f'{label}="{_escape_label(part)}"' for label, part in zip(labels, key))
+                lines.append(f"{metric}{{{label_text}}} {value(totals)}")
+        return "\n".join(lines) + "\n"
+
+    def _window_start(self, now: float) -> float:
+        """Start of the fixed budget window containing `now`"""
+        return now - now % self.budget_window
+
+
+def _escape_label(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _create_usage_service() -> UsageService:
+    """Create the usage service from environment configuration"""
+    prices = {**DEFAULT_PRICES, **_parse_prices(os.getenv('GEMINI_PRICES', ''))}
+
+    db_path = os.getenv('USAGE_DB_PATH')
+    ledger = UsageLedger(db_path) if db_path else None
+
+    action = os.getenv('CLIENT_BUDGET_ACTION', 'reject').lower()
+    if action not in BUDGET_ACTIONS:
+        print(f"⚠️  Unknown CLIENT_BUDGET_ACTION '{action}', using 'reject'")
+        action = "reject"
+
+    return UsageService(
+        prices,
+        ledger=ledger,
+        default_budget=int(os.getenv('CLIENT_TOKEN_BUDGET', '0')),
+        client_budgets=_parse_budgets(os.getenv('CLIENT_TOKEN_BUDGETS', '')),
+        budget_window=float(os.getenv('CLIENT_BUDGET_WINDOW_SECONDS', '86400')),
+        budget_action=action,
+        client_keys=_parse_client_keys(os.getenv('CLIENT_API_KEYS', ''))
+    )
+
+
+# Global instance
+_usage_service = None
+_usage_service_lock = threading.Lock()
+
+
+def get_usage_service() -> UsageService:
+    """Get the global usage service instance"""
+    global _usage_service
+    if _usage_service is None:
+        with _usage_service_lock:
+            if _usage_service is None:
+                _usage_service = _create_usage_service()
+    return _usage_service